@@ -1,10 +1,16 @@
+import logging
+
 from fastapi import APIRouter, UploadFile, Form, HTTPException
 from app.services.process_excel import process_excel
+from app.services.process_contratos import verificar_tamanho_upload
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
+
+TIPOS_UPLOAD = frozenset({"auditado", "nauditado"})
 
 @router.post("/upload/")
-async def upload_file(file: UploadFile, tipo: str = Form(...)):
+def upload_file(file: UploadFile, tipo: str = Form(...)):
     """
     Rota para upload e processamento de arquivo Excel.
     
@@ -15,18 +21,20 @@ async def upload_file(file: UploadFile, tipo: str = Form(...)):
     Retorna:
     - Arquivo Excel processado (.xlsx) como blob
     """
-    if tipo not in ["auditado", "nauditado"]:
+    if tipo not in TIPOS_UPLOAD:
         raise HTTPException(
             status_code=400,
             detail="O parâmetro 'tipo' deve ser 'auditado' ou 'nauditado'"
         )
+    verificar_tamanho_upload(file)
     
     try:
-        return await process_excel(file, tipo)
+        return process_excel(file, tipo)
     except HTTPException:
         raise
     except Exception as e:
+        logger.error(f"Erro ao processar arquivo {file.filename}: {e}", exc_info=e)
         raise HTTPException(
             status_code=500,
-            detail=f"Erro ao processar arquivo: {str(e)}"
+            detail="Erro ao processar arquivo"
         )
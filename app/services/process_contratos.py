@@ -1,22 +1,49 @@
 # pandas/openpyxl têm stubs incompletos; basedpyright acusa muitos falsos positivos aqui.
 # pyright: reportArgumentType=false, reportReturnType=false, reportAssignmentType=false, reportOperatorIssue=false, reportAttributeAccessIssue=false, reportOptionalMemberAccess=false, reportGeneralTypeIssues=false, reportCallIssue=false
+import asyncio
+import hashlib
 import pandas as pd
 import numpy as np
 import io
 import os
 import re
+import shutil
+import stat
+import tempfile
+import threading
+import time
+import zipfile
 import logging
+import logging.handlers
+import multiprocessing
 import unicodedata
-from typing import List, Optional
+from functools import lru_cache
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from pathlib import Path
 from datetime import datetime, date
 from dateutil.relativedelta import relativedelta
 from fastapi import HTTPException, UploadFile
 from fastapi.responses import StreamingResponse
+from openpyxl import load_workbook
+from pandas.errors import EmptyDataError
+from pandas.io.parsers import TextParser
+
+try:
+    from python_calamine import CalamineWorkbook
+except ImportError:  # leitura cai no openpyxl
+    CalamineWorkbook = None
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # saída colunar indisponível; só xlsx
+    pa = None
+    pq = None
 from openpyxl.utils import get_column_letter
 
-# Configurar logging para debug
-logging.basicConfig(level=logging.DEBUG)
+# Handlers e nível do log são configurados no main.py (aqui só o logger do módulo)
 logger = logging.getLogger(__name__)
 
 
@@ -51,23 +78,46 @@ def get_sheet_names(bank_type: str) -> dict:
         }
 
 
+# Sufixo no nome do arquivo -> tipo, em ordem de prioridade (nome que cita mais de um
+# tipo: 11, depois 12, depois 15). Novo tipo = nova entrada aqui.
+TIPOS_ARQUIVO = {
+    '11': '3026-11',
+    '12': '3026-12',
+    '15': '3026-15',
+}
+_RE_TIPO_ARQUIVO = re.compile(r'3026-?(' + '|'.join(TIPOS_ARQUIVO) + r')')
+
+# Valores aceitos nos parâmetros de process_contratos
+BANK_TYPES_VALIDOS = frozenset({'bemge', 'minas_caixa'})
+FILTER_TYPES_VALIDOS = frozenset({'auditado', 'nauditado', 'todos'})
+FILE_TYPES_VALIDOS = frozenset(TIPOS_ARQUIVO.values()) | {'todos'}
+VALORES_BOOLEANOS = frozenset({'true', 'false'})
+
+
+def arquivo_do_tipo(filename: Optional[str], file_type: str) -> bool:
+    """Se o nome do arquivo corresponde ao file_type pedido ('todos' aceita qualquer um)."""
+    if file_type == "todos":
+        return True
+    filename_upper = (filename or "").upper()
+    file_type_normalized = file_type.upper().replace("-", "")
+    return file_type.upper() in filename_upper or file_type_normalized in filename_upper
+
+
+@lru_cache(maxsize=1024)
 def detect_file_type(filename: Optional[str]) -> str:
     """
     Detecta o tipo de arquivo baseado no nome.
     Retorna: '3026-11', '3026-12' ou '3026-15'
     """
-    filename_upper = (filename or "").upper()
-    if '3026-11' in filename_upper or '302611' in filename_upper:
-        return '3026-11'
-    elif '3026-12' in filename_upper or '302612' in filename_upper:
-        return '3026-12'
-    elif '3026-15' in filename_upper or '302615' in filename_upper:
-        return '3026-15'
-    else:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Tipo de arquivo não reconhecido: {filename}. Esperado: 3026-11, 3026-12 ou 3026-15"
-        )
+    # Só dígitos e hífen no padrão: não precisa de upper() no nome
+    encontrados = set(_RE_TIPO_ARQUIVO.findall(filename or ""))
+    for sufixo, tipo in TIPOS_ARQUIVO.items():
+        if sufixo in encontrados:
+            return tipo
+    raise HTTPException(
+        status_code=400,
+        detail=f"Tipo de arquivo não reconhecido: {filename}. Esperado: 3026-11, 3026-12 ou 3026-15"
+    )
 
 
 def get_bank_name(bank_type: str) -> str:
@@ -114,12 +164,188 @@ def _cell_id_string(x) -> str:
     return str(x).strip()
 
 
+def _excel_header_names(header: tuple) -> list:
+    """Nomes de coluna como o pandas gera: 'Unnamed: i' para vazios e sufixo .1, .2 em repetidos."""
+    names = []
+    seen = {}
+    for i, h in enumerate(header):
+        name = f'Unnamed: {i}' if h is None or h == '' else h
+        if name in seen:
+            base = name
+            while name in seen:
+                seen[base] += 1
+                name = f'{base}.{seen[base]}'
+        seen[name] = 0
+        names.append(name)
+    return names
+
+
+def _valor_calamine(v):
+    """Célula do calamine no mesmo formato do openpyxl (vazio -> None, date -> datetime)."""
+    if isinstance(v, float):
+        return int(v) if v.is_integer() else v
+    if v == '':
+        return None
+    if isinstance(v, date) and not isinstance(v, datetime):
+        return datetime(v.year, v.month, v.day)
+    return v
+
+
+def _linhas_calamine(source) -> list:
+    if isinstance(source, (str, os.PathLike)):
+        wb = CalamineWorkbook.from_path(os.fspath(source))
+    else:
+        wb = CalamineWorkbook.from_filelike(source)
+    try:
+        rows = wb.get_sheet_by_index(0).to_python(skip_empty_area=False)
+    finally:
+        wb.close()
+    return [tuple(_valor_calamine(v) for v in row) for row in rows]
+
+
+def _linhas_openpyxl(source) -> list:
+    wb = load_workbook(source, read_only=True, data_only=True, keep_links=False)
+    try:
+        ws = wb.worksheets[0]
+        ws.reset_dimensions()
+        return [
+            tuple(int(v) if isinstance(v, float) and v.is_integer() else v for v in row)
+            for row in ws.iter_rows(values_only=True)
+        ]
+    finally:
+        wb.close()
+
+
+def _read_excel_fast(source) -> pd.DataFrame:
+    """
+    Lê a primeira aba do Excel com o mesmo resultado do pd.read_excel: as células saem
+    do calamine (Rust) quando disponível, ou do openpyxl em modo read_only se não estiver
+    instalado ou falhar com o arquivo, e passam pelo mesmo TextParser do read_excel
+    (texto só com dígitos vira número, 'NA'/'N/A' viram NaN, cabeçalho 'Unnamed: i').
+    Aceita caminho de arquivo, bytes ou qualquer objeto file-like.
+    """
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    rows = None
+    if CalamineWorkbook is not None:
+        try:
+            rows = _linhas_calamine(source)
+        except Exception as e:
+            logger.warning(f"calamine não conseguiu ler o arquivo, usando openpyxl: {e}")
+            if hasattr(source, 'seek'):
+                source.seek(0)
+    if rows is None:
+        rows = _linhas_openpyxl(source)
+
+    # Remover linhas e colunas vazias ao final (mesmo critério do read_excel)
+    while rows and all(v is None for v in rows[-1]):
+        rows.pop()
+    if not rows:
+        return pd.DataFrame()
+    width = max(
+        (max((i + 1 for i, v in enumerate(r) if v is not None), default=0) for r in rows),
+        default=0,
+    )
+    # Célula vazia como "" (o que os readers do pandas entregam ao TextParser)
+    data = [
+        ['' if v is None else v for v in r[:width]] + [''] * (width - len(r))
+        for r in rows
+    ]
+    try:
+        return TextParser(data, header=0, skip_blank_lines=False).read()
+    except EmptyDataError:
+        return pd.DataFrame()
+
+
+def ler_metadados_excel(source) -> tuple:
+    """
+    (total de linhas, colunas) da primeira aba, como len(df) e df.columns do read_excel,
+    sem montar o DataFrame: só o cabeçalho vira objeto Python e as linhas saem da
+    dimensão do intervalo lido pelo calamine. Sem calamine, cai no _read_excel_fast.
+    """
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    if CalamineWorkbook is None:
+        df = _read_excel_fast(source)
+        return len(df), list(df.columns)
+
+    wb = CalamineWorkbook.from_filelike(source)
+    try:
+        sheet = wb.get_sheet_by_index(0)
+        if sheet.start is None:
+            return 0, []
+        header = sheet.to_python(skip_empty_area=False, nrows=1)[0]
+        total_linhas = sheet.start[0] + sheet.height - 1
+    finally:
+        wb.close()
+    return total_linhas, _excel_header_names(tuple(_valor_calamine(v) for v in header))
+
+
+def _id_string_series(serie: pd.Series) -> pd.Series:
+    """
+    Equivalente vetorizado de `serie.apply(_cell_id_string)`:
+    - inteiros: conversão direta para texto
+    - float64: valores inteiros finitos (< 1e15) via int64; o restante pelo caminho geral
+    - caminho geral (object/misto): _cell_id_string uma vez por valor distinto
+    """
+    if len(serie) == 0:
+        return serie.apply(_cell_id_string)
+
+    def _por_valor_distinto(arr) -> np.ndarray:
+        codes, uniques = pd.factorize(arr)
+        convertidos = np.array([_cell_id_string(u) for u in uniques] + [''], dtype=object)
+        return convertidos[codes]  # código -1 (NaN) cai no '' final
+
+    valores = serie.to_numpy()
+    if valores.dtype.kind in 'iub':
+        out = valores.astype(np.int64).astype(str) if valores.dtype.kind == 'b' else valores.astype(str)
+    elif valores.dtype == np.float64:
+        with np.errstate(invalid='ignore'):
+            arred = np.round(valores)
+            inteiros = np.isfinite(valores) & (np.abs(valores - arred) < 1e-6) & (np.abs(arred) < 1e15)
+        out = np.empty(len(valores), dtype=object)
+        out[inteiros] = arred[inteiros].astype(np.int64).astype(str)
+        if not inteiros.all():
+            out[~inteiros] = _por_valor_distinto(valores[~inteiros])
+    else:
+        out = _por_valor_distinto(serie)
+    return pd.Series(out, index=serie.index, name=serie.name)
+
+
+def _inteiro_numerico(valor):
+    return int(valor) if pd.notna(valor) and isinstance(valor, (int, float)) else valor
+
+
+def _inteiro_series(serie: pd.Series) -> pd.Series:
+    """
+    Equivalente vetorizado de `serie.apply(_inteiro_numerico)` (número sem decimais):
+    - float64: truncado em numpy; int64 sem vazios, Int64 (nulo) com vazios
+    - bool: 0/1 em int64; inteiros: inalterados
+    - caminho geral (object/misto): _inteiro_numerico uma vez por valor distinto
+    """
+    valores = serie.to_numpy()
+    if valores.dtype.kind in 'iu':
+        return serie
+    if valores.dtype.kind == 'b':
+        return serie.astype(np.int64)
+    if valores.dtype == np.float64 and not np.isinf(valores).any():
+        truncados = np.trunc(valores)
+        if np.isnan(truncados).any():
+            return pd.Series(truncados, index=serie.index, name=serie.name).astype('Int64')
+        return pd.Series(truncados.astype(np.int64), index=serie.index, name=serie.name)
+    if len(serie) == 0 or isinstance(serie.dtype, pd.StringDtype):
+        return serie  # só texto: nada a converter
+    codes, uniques = pd.factorize(serie, use_na_sentinel=False)
+    convertidos = np.array([_inteiro_numerico(u) for u in uniques], dtype=object)
+    return pd.Series(convertidos[codes], index=serie.index, name=serie.name).infer_objects()
+
+
 def format_contrato_column(df: pd.DataFrame) -> pd.DataFrame:
     """
     Formata a coluna CONTRATO como texto, preservando zeros à esquerda.
     """
     if 'CONTRATO' in df.columns:
-        df['CONTRATO'] = df['CONTRATO'].apply(_cell_id_string)
+        df['CONTRATO'] = _id_string_series(df['CONTRATO'])
     return df
 
 
@@ -129,7 +355,7 @@ def format_column_d_as_text(df: pd.DataFrame) -> pd.DataFrame:
     """
     if len(df.columns) > 3:
         coluna_d = df.columns[3]
-        df[coluna_d] = df[coluna_d].apply(_cell_id_string)
+        df[coluna_d] = _id_string_series(df[coluna_d])
     return df
 
 
@@ -155,6 +381,65 @@ def _normalize_auditado_token(v) -> str:
     return t
 
 
+def _normalize_by_unique(serie: pd.Series, normalize) -> pd.Series:
+    """
+    Aplica `normalize` (função sobre uma Series) só aos valores distintos da coluna e
+    devolve o resultado como category: a normalização custa O(valores distintos) e os
+    isin/== seguintes comparam códigos inteiros em vez de strings.
+    """
+    codes, uniques = pd.factorize(serie, use_na_sentinel=False)
+    normalizados = normalize(pd.Series(uniques))
+    codes_norm, categorias = pd.factorize(normalizados)
+    return pd.Series(
+        pd.Categorical.from_codes(codes_norm[codes], categories=categorias),
+        index=serie.index,
+        name=serie.name,
+    )
+
+
+def _isin_categorias(serie: pd.Series, valores) -> pd.Series:
+    """
+    isin para Series category comparando códigos inteiros (categorias testadas uma vez só).
+    A máscara sai de uma tabela indexada pelo código: um acesso por linha, sem ordenar
+    como np.isin. A última posição (código -1, vazio) é sempre False.
+    """
+    categorias = serie.cat.categories
+    tabela = np.zeros(len(categorias) + 1, dtype=bool)
+    tabela[:-1] = categorias.isin(list(valores))
+    return pd.Series(tabela[serie.cat.codes.to_numpy()], index=serie.index)
+
+
+def _upper_strip(valores: pd.Series) -> pd.Series:
+    return valores.astype(str).str.upper().str.strip()
+
+
+def _auditado_tokens(valores: pd.Series) -> pd.Series:
+    return valores.map(_normalize_auditado_token)
+
+
+def _contrato_duplicate_masks(serie: pd.Series) -> tuple:
+    """
+    Máscaras de duplicidade de CONTRATO com uma única passada de hash (factorize).
+    Retorna (primeira_ocorrencia, repetido, n_unicos):
+    - primeira_ocorrencia: equivalente a ~duplicated(keep='first')
+    - repetido: equivalente a duplicated(keep=False)
+    - n_unicos: equivalente a nunique() (NaN não conta)
+    """
+    codes, uniques = pd.factorize(serie, use_na_sentinel=False)
+    if len(codes) == 0:
+        vazio = np.zeros(0, dtype=bool)
+        return vazio, vazio, 0
+    # factorize numera os valores por ordem de aparição: a primeira ocorrência de
+    # cada código é onde o máximo acumulado cresce.
+    maximo = np.maximum.accumulate(codes)
+    primeira_ocorrencia = np.empty(len(codes), dtype=bool)
+    primeira_ocorrencia[0] = True
+    primeira_ocorrencia[1:] = maximo[1:] > maximo[:-1]
+    repetido = np.bincount(codes, minlength=len(uniques))[codes] > 1
+    n_unicos = len(uniques) - int(pd.isna(uniques).any())
+    return primeira_ocorrencia, repetido, n_unicos
+
+
 # Classificação AUD / NAUD (mesmo critério do 3026-12) para 3026-11/15 e consolidação
 AUD_CLASSIFY_TOKENS = frozenset({
     'AUDI', 'AUD', 'AUDITADO', 'AUDITADOS', 'AUDIT.', 'SIM', 'S',
@@ -166,18 +451,48 @@ NAUD_CLASSIFY_TOKENS = frozenset({
 })
 
 
+# Colunas de baixa cardinalidade como category com dicionário fixo: todos os arquivos
+# compartilham as mesmas categorias, então o concat da consolidação não volta para object.
+COLUNAS_CATEGORICAS = {
+    'TIPO_ARQUIVO': pd.CategoricalDtype(['3026-11', '3026-12', '3026-15']),
+    'BANCO': pd.CategoricalDtype(['BEMGE', 'MINAS CAIXA']),
+    'AUDITADO_TIPO': pd.CategoricalDtype(['AUD', 'INDEF', 'NAUD']),
+}
+
+
+def _colunas_constantes(n: int, **valores) -> dict:
+    """Colunas constantes já como category (códigos direto, sem materializar n strings)."""
+    colunas = {}
+    for col, valor in valores.items():
+        dtype = COLUNAS_CATEGORICAS[col]
+        codigo = dtype.categories.get_indexer([valor])[0]
+        colunas[col] = pd.Categorical.from_codes(np.full(n, codigo, dtype=np.int8), dtype=dtype)
+    return colunas
+
+
+def _audit_mask(df: pd.DataFrame, filter_type: str) -> Optional[np.ndarray]:
+    """
+    Máscara (ndarray bool) das linhas no escopo de filter_type 'auditado'/'nauditado'.
+    Usa AUDITADO_TIPO (category, comparação pelos códigos) quando existir; senão os tokens
+    normalizados de AUDITADO (3026-11 / 3026-15). None = nada a restringir.
+    """
+    if filter_type not in ('auditado', 'nauditado'):
+        return None
+    if 'AUDITADO_TIPO' in df.columns:
+        return df['AUDITADO_TIPO'].eq('AUD' if filter_type == 'auditado' else 'NAUD').to_numpy(dtype=bool)
+    if 'AUDITADO' in df.columns:
+        keys = _normalize_by_unique(df['AUDITADO'], _auditado_tokens)
+        tokens = AUD_CLASSIFY_TOKENS if filter_type == 'auditado' else NAUD_CLASSIFY_TOKENS
+        return _isin_categorias(keys, tokens).to_numpy(dtype=bool)
+    return None
+
+
 def filtrar_dataframe_por_tipo_auditado(df: pd.DataFrame, filter_type: str) -> pd.DataFrame:
-    """Restringe linhas pela coluna AUDITADO (3026-11 / 3026-15) com tokens normalizados."""
-    if df is None or df.empty or filter_type == 'todos':
-        return df.copy() if df is not None and not df.empty else df
-    if 'AUDITADO' not in df.columns:
-        return df.copy()
-    keys = df['AUDITADO'].map(_normalize_auditado_token)
-    if filter_type == 'auditado':
-        return df[keys.isin(AUD_CLASSIFY_TOKENS)].copy()
-    if filter_type == 'nauditado':
-        return df[keys.isin(NAUD_CLASSIFY_TOKENS)].copy()
-    return df.copy()
+    """Restringe linhas pelo tipo auditado (AUDITADO_TIPO ou AUDITADO, ver _audit_mask)."""
+    if df is None or df.empty:
+        return df
+    mask = _audit_mask(df, filter_type)
+    return df if mask is None else df.take(np.flatnonzero(mask))
 
 
 def aplicar_escopo_filter_type(df: pd.DataFrame, filter_type: str) -> pd.DataFrame:
@@ -185,17 +500,9 @@ def aplicar_escopo_filter_type(df: pd.DataFrame, filter_type: str) -> pd.DataFra
     Aplica o mesmo 'filtro de opção' do front em toda a consolidação:
     Resumo, Repetidos, Por Banco e base de Dados Filtrados ficam alinhados.
     """
-    if df is None or len(df) == 0:
-        return df.copy() if df is not None else pd.DataFrame()
-    if filter_type == 'todos':
-        return df.copy()
-    out = df.copy()
-    if 'AUDITADO_TIPO' in out.columns:
-        if filter_type == 'auditado':
-            return out[out['AUDITADO_TIPO'].eq('AUD')].copy()
-        if filter_type == 'nauditado':
-            return out[out['AUDITADO_TIPO'].eq('NAUD')].copy()
-    return filtrar_dataframe_por_tipo_auditado(out, filter_type)
+    if df is None:
+        return pd.DataFrame()
+    return filtrar_dataframe_por_tipo_auditado(df, filter_type)
 
 
 def _effective_aba_key_3026_12(chave_dados: str, filter_type: str) -> Optional[str]:
@@ -260,7 +567,7 @@ def resolve_manifestacao_column(
         if len(df.columns) <= idx:
             continue
         col = df.columns[idx]
-        s = pd.to_datetime(df[col], errors='coerce', dayfirst=True)
+        s = _to_datetime(df[col])
         score = float(s.notna().mean())
         if score > best_score:
             best_col, best_score = col, score
@@ -278,26 +585,92 @@ def resolve_manifestacao_column(
     return None
 
 
+# Formatos de data brasileiros das planilhas (testados no primeiro texto não nulo da coluna).
+# Textos em outros formatos seguem pela inferência do pandas com dayfirst=True.
+FORMATOS_DATA_CONHECIDOS = ('%d/%m/%Y', '%d/%m/%Y %H:%M:%S')
+_TEXTOS_NULOS = frozenset({'', 'nan', 'nat', 'none', 'null'})
+
+
+def _sniff_formato_data(serie: pd.Series) -> Optional[str]:
+    """Formato do primeiro texto não nulo da coluna, se for um dos FORMATOS_DATA_CONHECIDOS."""
+    if serie.dtype.kind == 'M':
+        return None
+    for v in serie.to_numpy():
+        if v is None or v is pd.NaT or (isinstance(v, float) and np.isnan(v)):
+            continue
+        if type(v) is not str:
+            return None
+        texto = v.strip()
+        if texto.lower() in _TEXTOS_NULOS:
+            continue
+        if texto != v:
+            return None
+        for fmt in FORMATOS_DATA_CONHECIDOS:
+            try:
+                datetime.strptime(v, fmt)
+                return fmt
+            except ValueError:
+                continue
+        return None
+    return None
+
+
+def _to_datetime_direto(serie: pd.Series) -> pd.Series:
+    fmt = _sniff_formato_data(serie)
+    if fmt is not None:
+        return pd.to_datetime(serie, errors='coerce', format=fmt)
+    return pd.to_datetime(serie, errors='coerce', dayfirst=True)
+
+
+def _to_datetime(serie: pd.Series) -> pd.Series:
+    """
+    pd.to_datetime(errors='coerce', dayfirst=True) passando `format=` quando o primeiro
+    texto da coluna casa com um formato conhecido: vai direto ao parser C do strptime,
+    sem adivinhar o formato a cada chamada.
+    Colunas texto/object com valores repetidos são convertidas uma vez por valor distinto.
+    """
+    if len(serie) and (serie.dtype == object or pd.api.types.is_string_dtype(serie)):
+        codes, uniques = pd.factorize(serie)
+        if len(uniques) * 2 <= len(serie):
+            # factorize mantém a ordem de aparição: o formato inferido é o mesmo
+            convertidos = _to_datetime_direto(pd.Series(uniques, dtype=object))
+            return pd.Series(
+                convertidos.array.take(codes, allow_fill=True),
+                index=serie.index,
+                name=serie.name,
+            )
+    return _to_datetime_direto(serie)
+
+
+# Possíveis nomes de colunas de data
+COLUNAS_DATA_CONHECIDAS = frozenset({
+    'DT.ASS.', 'DT.EVENTO', 'DT.HAB.', 'DT.PROC.HAB.',
+    'DT.ASS', 'DT.HAB', 'DT.PROC.HAB',
+    'DATA ASS.', 'DATA EVENTO', 'DATA HAB.', 'DATA PROC.HAB.',
+    'DT.BASE', 'DT.TERM.ANALISE', 'DT.MANIFESTACAO', 'DT.POS.NOVACAO',
+    'DT.ULT.AUDITORIA', 'DT.ULT.NEGOCIACAO', 'DATA STATUS'
+})
+
+
+@lru_cache(maxsize=1024)
+def _is_date_column_name(col_name) -> bool:
+    """Coluna de data pelo nome: está na lista ou começa com DT. ou DATA (uma única upper())."""
+    if col_name in COLUNAS_DATA_CONHECIDAS:
+        return True
+    return str(col_name).upper().startswith(('DT.', 'DATA'))
+
+
 def format_date_columns(df: pd.DataFrame) -> pd.DataFrame:
     """
     Formata colunas de data, removendo a hora.
     Colunas afetadas: DT.ASS., DT.EVENTO, DT.HAB., DT.PROC.HAB. e variações
     """
-    # Lista de possíveis nomes de colunas de data
-    colunas_data = [
-        'DT.ASS.', 'DT.EVENTO', 'DT.HAB.', 'DT.PROC.HAB.',
-        'DT.ASS', 'DT.EVENTO', 'DT.HAB', 'DT.PROC.HAB',
-        'DATA ASS.', 'DATA EVENTO', 'DATA HAB.', 'DATA PROC.HAB.',
-        'DT.BASE', 'DT.TERM.ANALISE', 'DT.MANIFESTACAO', 'DT.POS.NOVACAO',
-        'DT.ULT.AUDITORIA', 'DT.ULT.NEGOCIACAO', 'DATA STATUS'
-    ]
-    
     for col in df.columns:
         # Verificar se a coluna está na lista ou começa com DT. ou DATA
-        if col in colunas_data or col.upper().startswith('DT.') or col.upper().startswith('DATA'):
+        if _is_date_column_name(col):
             try:
-                # Converter para datetime e extrair apenas a data
-                df[col] = pd.to_datetime(df[col], errors='coerce', dayfirst=True).dt.date
+                # Converter para datetime64 sem hora (formato DD/MM/YYYY aplicado só na escrita do Excel)
+                df[col] = _to_datetime(df[col]).dt.normalize()
                 logger.debug(f"Coluna de data formatada: {col}")
             except Exception as e:
                 logger.warning(f"Erro ao formatar coluna de data {col}: {e}")
@@ -333,7 +706,7 @@ def format_object_columns_that_look_like_dates(df: pd.DataFrame, max_scan_cols:
             if not has_dt_obj and has_sep_ratio < 0.08:
                 continue
 
-            parsed = pd.to_datetime(sample, errors='coerce', dayfirst=True)
+            parsed = _to_datetime(sample)
             ratio = float(parsed.notna().mean())
             if ratio < 0.45:
                 continue
@@ -344,7 +717,7 @@ def format_object_columns_that_look_like_dates(df: pd.DataFrame, max_scan_cols:
                 if plausible_year_ratio < 0.70:
                     continue
 
-            df[col] = pd.to_datetime(df[col], errors='coerce', dayfirst=True).dt.date
+            df[col] = _to_datetime(df[col]).dt.normalize()
             logger.debug(f"Coluna object tratada como data: {col!r} (~{ratio:.0%} amostra válida)")
         except Exception:
             continue
@@ -360,7 +733,7 @@ def format_date_columns_by_index(df: pd.DataFrame, indices: list) -> pd.DataFram
         if len(df.columns) > idx:
             col = df.columns[idx]
             try:
-                df[col] = pd.to_datetime(df[col], errors='coerce', dayfirst=True).dt.date
+                df[col] = _to_datetime(df[col]).dt.normalize()
                 logger.debug(f"Coluna de data (índice {idx}) formatada: {col}")
             except Exception as e:
                 logger.warning(f"Erro ao formatar coluna de data índice {idx} ({col}): {e}")
@@ -368,14 +741,30 @@ def format_date_columns_by_index(df: pd.DataFrame, indices: list) -> pd.DataFram
     return df
 
 
+def optimize_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Reduz colunas inteiras para o menor tipo que comporta os valores (int64 -> int32/16/8).
+    Só inteiros: float32 mudaria valores gravados e category quebra atribuições/fillna
+    com valores novos nas etapas seguintes.
+    """
+    for idx in range(len(df.columns)):
+        serie = df.iloc[:, idx]
+        if serie.dtype.kind not in 'iu':
+            continue
+        reduzida = pd.to_numeric(serie, downcast='integer')
+        if reduzida.dtype != serie.dtype:
+            df.isetitem(idx, reduzida)
+    return df
+
+
 def remove_general_columns(df: pd.DataFrame) -> pd.DataFrame:
     """
     Remove colunas AF, AG, AH (INDVAF3TR7, INDVAF4TR7, DT.ULT.HOMOLOGACAO).
     """
-    colunas_remover_geral = ['INDVAF3TR7', 'INDVAF4TR7', 'DT.ULT.HOMOLOGACAO']
-    for col in colunas_remover_geral:
-        if col in df.columns:
-            df = df.drop(columns=[col])
+    colunas_remover_geral = df.columns.intersection(['INDVAF3TR7', 'INDVAF4TR7', 'DT.ULT.HOMOLOGACAO'])
+    if len(colunas_remover_geral):
+        # Um único drop (um rebuild do frame) em vez de um por coluna
+        df = df.drop(columns=colunas_remover_geral)
     return df
 
 
@@ -434,7 +823,7 @@ def apply_habitacional_filter(
             logger.info(f"   Processando coluna {col_name} (índice {col_idx}): '{col}'")
             
             # Tentar converter para datetime
-            parsed_dates = pd.to_datetime(df[col], errors='coerce', dayfirst=True)
+            parsed_dates = _to_datetime(df[col])
             valid_dates = parsed_dates.notna().sum()
             
             logger.info(f"      Datas válidas: {valid_dates}/{initial_count}")
@@ -467,7 +856,7 @@ def apply_habitacional_filter(
             return df
         
         # Aplicar máscara combinada
-        df_filtrado = df[combined_mask].copy()
+        df_filtrado = df[combined_mask]
         result_count = len(df_filtrado)
         
         logger.info(f"   ✅ FILTRO HABITACIONAL APLICADO")
@@ -486,6 +875,15 @@ def apply_habitacional_filter(
         return df
 
 
+def _mascara_periodo(parsed: pd.Series, data_corte: date, data_ref: date) -> np.ndarray:
+    """
+    Máscara da janela [data_corte, data_ref] (inclusive, por dia) sobre datas já convertidas
+    (NaT fica fora). Separada da conversão para poder reaproveitar as datas de uma coluna.
+    """
+    dias = parsed.dt.floor('D')
+    return ((dias >= pd.Timestamp(data_corte)) & (dias <= pd.Timestamp(data_ref))).to_numpy()
+
+
 def filter_by_period(
     df: pd.DataFrame,
     reference_date: Optional[str] = None,
@@ -532,9 +930,7 @@ def filter_by_period(
         
         logger.info(f"   Intervalo: {data_corte} até {data_ref}")
         
-        df_temp = df.copy()
-        parsed = pd.to_datetime(df_temp[col_manifestacao], errors='coerce', dayfirst=True)
-        parsed_day = parsed.dt.floor('D')
+        parsed = _to_datetime(df[col_manifestacao])
         
         valid_dates = int(parsed.notna().sum())
         logger.info(f"   Datas válidas: {valid_dates}/{initial_count}")
@@ -554,8 +950,7 @@ def filter_by_period(
         except Exception as ex:
             logger.warning(f"   Não foi possível exibir range de datas: {ex}")
         
-        mask = (parsed_day >= pd.Timestamp(data_corte)) & (parsed_day <= pd.Timestamp(data_ref))
-        df_filtrado = df[mask].copy()
+        df_filtrado = df[_mascara_periodo(parsed, data_corte, data_ref)]
         
         result_count = len(df_filtrado)
         logger.info(f"   ✅ FILTRO DE PERÍODO APLICADO")
@@ -588,7 +983,8 @@ def process_3026_11(df: pd.DataFrame, bank_name: str) -> tuple:
     - Formata coluna D como texto
     - Remove duplicados na coluna CONTRATO
     - Para MINAS CAIXA: formata colunas T, X, Z (índices 19, 23, 25) removendo horas
-    Retorna: (df_processado, total_linhas, total_unicos, total_duplicados)
+    Retorna: (df_processado, total_linhas, total_unicos, total_duplicados, duplicado)
+    `duplicado` é a máscara DUPLICADO alinhada a df_processado (CONTRATO repetido).
     """
     logger.debug(f"Processando 3026-11 para {bank_name} - Linhas: {len(df)}, Colunas: {len(df.columns)}")
     logger.debug(f"Colunas do 3026-11: {list(df.columns)[:10]}...")
@@ -596,10 +992,7 @@ def process_3026_11(df: pd.DataFrame, bank_name: str) -> tuple:
     # Verificar se DataFrame está vazio
     if df.empty:
         logger.warning(f"DataFrame 3026-11 está vazio para {bank_name}")
-        return pd.DataFrame(), 0, 0, 0
-    
-    # Fazer cópia para evitar problemas de referência
-    df = df.copy()
+        return pd.DataFrame(), 0, 0, 0, np.zeros(0, dtype=bool)
     
     # MINAS CAIXA: datas em T, X, Z e colunas comuns de manifestação / período
     if 'MINAS' in bank_name.upper():
@@ -631,22 +1024,25 @@ def process_3026_11(df: pd.DataFrame, bank_name: str) -> tuple:
     df = format_contrato_column(df)
     
     total_linhas = len(df)
-    nunique_c = int(df['CONTRATO'].nunique())
+    primeiros, repetidos, nunique_c = _contrato_duplicate_masks(df['CONTRATO'])
 
     # Minas: não remover linhas com mesmo contrato (evita “sumir” contrato por arredondamento Excel)
     if 'MINAS' in bank_name.upper():
-        df_processado = df.copy()
+        df_processado = df
+        duplicado = repetidos
         total_unicos = nunique_c
         total_duplicados = total_linhas - nunique_c
         logger.debug(f"3026-11 Minas: sem drop_duplicates por CONTRATO; linhas={total_linhas}, nunique={nunique_c}")
     else:
-        df_processado = df.drop_duplicates(subset=['CONTRATO'], keep='first').copy()
+        df_processado = df[primeiros]
+        # Após o drop_duplicates nenhum CONTRATO se repete
+        duplicado = np.zeros(len(df_processado), dtype=bool)
         total_unicos = len(df_processado)
         total_duplicados = total_linhas - total_unicos
     
     logger.debug(f"3026-11 processado: total={total_linhas}, únicos={total_unicos}, duplicados={total_duplicados}")
     
-    return df_processado, total_linhas, total_unicos, total_duplicados
+    return df_processado, total_linhas, total_unicos, total_duplicados, duplicado
 
 
 def process_3026_15(df: pd.DataFrame, bank_name: str) -> tuple:
@@ -654,7 +1050,8 @@ def process_3026_15(df: pd.DataFrame, bank_name: str) -> tuple:
     Processa arquivos 3026-15.
     - Formata coluna D como texto
     - Remove duplicados na coluna CONTRATO
-    Retorna: (df_processado, total_linhas, total_unicos, total_duplicados)
+    Retorna: (df_processado, total_linhas, total_unicos, total_duplicados, duplicado)
+    `duplicado` é a máscara DUPLICADO alinhada a df_processado (CONTRATO repetido).
     """
     logger.debug(f"Processando 3026-15 para {bank_name} - Linhas: {len(df)}, Colunas: {len(df.columns)}")
     logger.debug(f"Colunas do 3026-15: {list(df.columns)[:10]}...")
@@ -662,10 +1059,7 @@ def process_3026_15(df: pd.DataFrame, bank_name: str) -> tuple:
     # Verificar se DataFrame está vazio
     if df.empty:
         logger.warning(f"DataFrame 3026-15 está vazio para {bank_name}")
-        return pd.DataFrame(), 0, 0, 0
-    
-    # Fazer cópia para evitar problemas de referência
-    df = df.copy()
+        return pd.DataFrame(), 0, 0, 0, np.zeros(0, dtype=bool)
     
     # Formatar coluna D como texto
     df = format_column_d_as_text(df)
@@ -692,21 +1086,24 @@ def process_3026_15(df: pd.DataFrame, bank_name: str) -> tuple:
     df = format_contrato_column(df)
     
     total_linhas = len(df)
-    nunique_c = int(df['CONTRATO'].nunique())
+    primeiros, repetidos, nunique_c = _contrato_duplicate_masks(df['CONTRATO'])
 
     if 'MINAS' in bank_name.upper():
-        df_processado = df.copy()
+        df_processado = df
+        duplicado = repetidos
         total_unicos = nunique_c
         total_duplicados = total_linhas - nunique_c
         logger.debug(f"3026-15 Minas: sem drop_duplicates por CONTRATO")
     else:
-        df_processado = df.drop_duplicates(subset=['CONTRATO'], keep='first').copy()
+        df_processado = df[primeiros]
+        # Após o drop_duplicates nenhum CONTRATO se repete
+        duplicado = np.zeros(len(df_processado), dtype=bool)
         total_unicos = len(df_processado)
         total_duplicados = total_linhas - total_unicos
     
     logger.debug(f"3026-15 processado: total={total_linhas}, únicos={total_unicos}, duplicados={total_duplicados}")
     
-    return df_processado, total_linhas, total_unicos, total_duplicados
+    return df_processado, total_linhas, total_unicos, total_duplicados, duplicado
 
 
 def process_3026_12(df: pd.DataFrame, bank_name: str) -> dict:
@@ -733,9 +1130,6 @@ def process_3026_12(df: pd.DataFrame, bank_name: str) -> dict:
             'todos_full': pd.DataFrame(),
         }
     
-    # Fazer cópia para evitar problemas de referência
-    df = df.copy()
-    
     logger.debug(f"Colunas do 3026-12: {list(df.columns)[:15]}...")
     
     # 1. Coluna B - Manter apenas linhas onde = 52101
@@ -743,8 +1137,7 @@ def process_3026_12(df: pd.DataFrame, bank_name: str) -> dict:
         coluna_b = df.columns[1]
         logger.debug(f"Coluna B (índice 1): {coluna_b}")
         # Converter para string, removendo .0 de números float
-        df[coluna_b] = df[coluna_b].apply(_cell_id_string)
-        df[coluna_b] = df[coluna_b].str.strip()
+        df[coluna_b] = _id_string_series(df[coluna_b]).str.strip()
         linhas_antes = len(df)
         
         # Verificar se existe o valor 52101
@@ -752,7 +1145,7 @@ def process_3026_12(df: pd.DataFrame, bank_name: str) -> dict:
         logger.debug(f"Valores únicos na coluna B (amostra): {valores_unicos}")
         
         # Filtrar por 52101
-        df_filtrado = df[df[coluna_b] == '52101'].copy()
+        df_filtrado = df[df[coluna_b].to_numpy() == '52101']
         linhas_depois = len(df_filtrado)
         logger.debug(f"Filtro coluna B=52101: {linhas_antes} -> {linhas_depois} linhas")
         
@@ -779,9 +1172,7 @@ def process_3026_12(df: pd.DataFrame, bank_name: str) -> dict:
         if len(df.columns) > idx:
             col = df.columns[idx]
             logger.debug(f"Formatando coluna índice {idx} ({col}) como inteiro")
-            df[col] = df[col].apply(
-                lambda x: int(x) if pd.notna(x) and isinstance(x, (int, float)) else x
-            )
+            df[col] = _inteiro_series(df[col])
     
     # 4. Remover colunas BT e BU (índices 71 e 72, 0-based)
     if len(df.columns) > 72:
@@ -828,62 +1219,66 @@ def process_3026_12(df: pd.DataFrame, bank_name: str) -> dict:
     
     aud_tokens = AUD_CLASSIFY_TOKENS
     naud_tokens = NAUD_CLASSIFY_TOKENS
-    keys = df[coluna_auditado].map(_normalize_auditado_token)
-    extra_map = {_normalize_auditado_token(v) for v in df[coluna_auditado].unique() if pd.notna(v)}
-    logger.debug(f"AUDITADO chaves normalizadas (amostra): {list(extra_map)[:25]}")
+    keys = _normalize_by_unique(df[coluna_auditado], _auditado_tokens)
+    logger.debug(f"AUDITADO chaves normalizadas (amostra): {list(keys.cat.categories)[:25]}")
     
-    df_aud = df[keys.isin(aud_tokens)].copy()
-    df_naud = df[keys.isin(naud_tokens)].copy()
+    mask_aud = _isin_categorias(keys, aud_tokens)
+    mask_naud = _isin_categorias(keys, naud_tokens)
     
-    logger.debug(f"Após separação: AUD={len(df_aud)}, NAUD={len(df_naud)}")
-    
-    classified = keys.isin(aud_tokens) | keys.isin(naud_tokens)
+    classified = mask_aud | mask_naud
     n_unc = int((~classified).sum())
     if n_unc:
         amostra = df.loc[~classified, coluna_auditado].dropna().unique()[:8]
         logger.warning(f"3026-12: {n_unc} linhas com AUDITADO não classificado; valores: {amostra}")
     
-    df_todos_full = df.copy()
-    df_todos_full['BANCO'] = bank_name
-    df_todos_full['TIPO_ARQUIVO'] = '3026-12'
-    df_todos_full['AUDITADO_TIPO'] = keys.map(
-        lambda k: 'AUD' if k in aud_tokens else ('NAUD' if k in naud_tokens else 'INDEF')
+    # Classe de cada linha calculada uma vez, como códigos do dtype de AUDITADO_TIPO:
+    # alimenta a coluna AUDITADO_TIPO, os totais (bincount) e a separação AUD/NAUD
+    dtype_classe = COLUNAS_CATEGORICAS['AUDITADO_TIPO']
+    cod_aud, cod_naud, cod_indef = (
+        dtype_classe.categories.get_loc(c) for c in ('AUD', 'NAUD', 'INDEF')
+    )
+    codigos = np.select(
+        [mask_aud.to_numpy(), mask_naud.to_numpy()], [cod_aud, cod_naud], default=cod_indef
+    )
+    
+    df_todos_full = df.assign(
+        **_colunas_constantes(len(df), BANCO=bank_name, TIPO_ARQUIVO='3026-12'),
+        AUDITADO_TIPO=pd.Categorical.from_codes(codigos, dtype=dtype_classe),
+        DUPLICADO=_contrato_duplicate_masks(df['CONTRATO'])[1],
     )
-    df_todos_full['DUPLICADO'] = df_todos_full['CONTRATO'].duplicated(keep=False)
     
-    # Aplicar filtros se as colunas existirem
+    # Filtros DEST.* combinados numa única máscara (sem cópias por ramo AUD/NAUD)
     valores_filtro = ['0X0', '1X4', '6X4', '8X4', '0x0', '1x4', '6x4', '8x4']
     
+    keep = classified
+    dest_normalizadas = {}
     if has_filter_cols:
         for col in filter_cols:
-            if col in df_aud.columns and len(df_aud) > 0:
-                df_aud[col] = df_aud[col].astype(str).str.upper().str.strip()
-                mask = ~df_aud[col].isin(valores_filtro)
-                df_aud = df_aud[mask].copy()
-            
-            if col in df_naud.columns and len(df_naud) > 0:
-                df_naud[col] = df_naud[col].astype(str).str.upper().str.strip()
-                mask = ~df_naud[col].isin(valores_filtro)
-                df_naud = df_naud[mask].copy()
-    
-    # Processar AUD
-    total_aud = len(df_aud)
-    if total_aud > 0:
-        df_aud_unicos = df_aud.drop_duplicates(subset=['CONTRATO'], keep='first')
-        unicos_aud = len(df_aud_unicos)
-    else:
-        df_aud_unicos = pd.DataFrame()
-        unicos_aud = 0
-    duplicados_aud = total_aud - unicos_aud
+            if col in df.columns:
+                dest_normalizadas[col] = _normalize_by_unique(df[col], _upper_strip)
+                keep = keep & ~_isin_categorias(dest_normalizadas[col], valores_filtro)
     
-    # Processar NAUD
-    total_naud = len(df_naud)
-    if total_naud > 0:
-        df_naud_unicos = df_naud.drop_duplicates(subset=['CONTRATO'], keep='first')
-        unicos_naud = len(df_naud_unicos)
-    else:
-        df_naud_unicos = pd.DataFrame()
-        unicos_naud = 0
+    keep_arr = keep.to_numpy()
+    classe = codigos[keep_arr]
+    totais = np.bincount(classe, minlength=len(dtype_classe.categories))
+    total_aud = int(totais[cod_aud])
+    total_naud = int(totais[cod_naud])
+    logger.debug(f"Após separação e filtros: AUD={total_aud}, NAUD={total_naud}")
+    
+    # Deduplicar por (classe, CONTRATO) e materializar apenas as linhas finais
+    chaves = pd.DataFrame({'classe': classe, 'contrato': df['CONTRATO'].to_numpy()[keep_arr]})
+    primeiros = ~chaves.duplicated(keep='first').to_numpy()
+    posicoes = np.flatnonzero(keep_arr)[primeiros]
+    df_dedup = df.iloc[posicoes]
+    if dest_normalizadas:
+        df_dedup = df_dedup.assign(**{col: serie.iloc[posicoes] for col, serie in dest_normalizadas.items()})
+    
+    grupos = dict(list(df_dedup.groupby(classe[primeiros], sort=False)))
+    df_aud_unicos = grupos.get(cod_aud, pd.DataFrame())
+    df_naud_unicos = grupos.get(cod_naud, pd.DataFrame())
+    unicos_aud = len(df_aud_unicos)
+    unicos_naud = len(df_naud_unicos)
+    duplicados_aud = total_aud - unicos_aud
     duplicados_naud = total_naud - unicos_naud
     
     logger.debug(f"AUD: total={total_aud}, únicos={unicos_aud}, duplicados={duplicados_aud}")
@@ -913,7 +1308,7 @@ def filtrar_planilha_contratos(
     if df.empty:
         return df
 
-    df_filtrado = df.copy()
+    df_filtrado = df
 
     # Filtro de período
     if aplicar_periodo:
@@ -930,22 +1325,30 @@ def filtrar_planilha_contratos(
             months_back=months_back
         )
 
+    # DEST.* e 3026-15 viram uma única máscara de linhas removidas, aplicada uma vez só
+    remove = np.zeros(len(df_filtrado), dtype=bool)
+
     # DEST.PAGAM / DEST.COMPLEM: regra do 3026-12 — não aplicar em 3026-11 / 3026-15
     valores_filtro = {'0X0', '1X4', '6X4', '8X4'}
     filter_cols = ['DEST.PAGAM', 'DEST.COMPLEM']
-    if 'TIPO_ARQUIVO' in df_filtrado.columns:
-        mask_somente_12 = df_filtrado['TIPO_ARQUIVO'].eq('3026-12')
-    else:
-        mask_somente_12 = pd.Series(True, index=df_filtrado.index)
-    for col in filter_cols:
-        if col not in df_filtrado.columns or df_filtrado.empty:
-            continue
-        norm = df_filtrado[col].astype(str).str.upper().str.strip()
-        remove = norm.isin(valores_filtro) & mask_somente_12
-        df_filtrado = df_filtrado[~remove].copy()
+    cols_presentes = [col for col in filter_cols if col in df_filtrado.columns]
+    if cols_presentes and not df_filtrado.empty:
+        if 'TIPO_ARQUIVO' in df_filtrado.columns:
+            mask_somente_12 = df_filtrado['TIPO_ARQUIVO'].eq('3026-12').to_numpy()
+        else:
+            mask_somente_12 = np.ones(len(df_filtrado), dtype=bool)
+        # Normaliza só as linhas 3026-12 (as demais nunca são removidas)
+        if mask_somente_12.any():
+            for col in cols_presentes:
+                norm = _normalize_by_unique(df_filtrado[col][mask_somente_12], _upper_strip)
+                remove[mask_somente_12] |= _isin_categorias(norm, valores_filtro).to_numpy()
 
     if aplicar_3026_15 and 'TIPO_ARQUIVO' in df_filtrado.columns:
-        df_filtrado = df_filtrado[df_filtrado['TIPO_ARQUIVO'] == '3026-15'].copy()
+        remove |= df_filtrado['TIPO_ARQUIVO'].ne('3026-15').to_numpy()
+
+    if remove.any():
+        # take devolve um frame novo: sem .copy() adicional
+        df_filtrado = df_filtrado.take(np.flatnonzero(~remove))
 
     return df_filtrado
 
@@ -956,10 +1359,13 @@ def processar_3026_12_com_abas(
     bank_type: str,
     period_filter_active: bool,
     reference_date: Optional[str],
-    months_back: int
+    months_back: int,
+    filter_type: str = 'todos'
 ) -> dict:
     """
     ✅ CORRIGIDO: Processa 3026-12 com tratamento robusto de erros
+    Com filter_type 'auditado'/'nauditado' só monta as abas que serão lidas
+    (ver _effective_aba_key_3026_12); as estatísticas vêm sempre completas.
     """
     try:
         resumo = process_3026_12(df, bank_name)
@@ -970,25 +1376,35 @@ def processar_3026_12_com_abas(
 
         df_aud, total_aud, unicos_aud, duplicados_aud = resumo['aud']
         df_naud, total_naud, unicos_naud, duplicados_naud = resumo['naud']
-        df_todos = resumo['todos_full']
+        precisa_aud = filter_type != 'nauditado'
+        precisa_naud = filter_type != 'auditado'
+        if filter_type == 'todos':
+            df_todos = resumo['todos_full']
+        else:
+            df_todos = pd.DataFrame()  # aba 'todos' redirecionada para aud/naud
 
-        logger.info(f"📊 3026-12 separado: AUD={len(df_aud)}, NAUD={len(df_naud)}, TODOS={len(df_todos)}")
+        logger.info(f"📊 3026-12 separado: AUD={len(df_aud)}, NAUD={len(df_naud)}, TODOS={len(resumo['todos_full'])}")
 
         def preparar_sub_df(sub_df: pd.DataFrame, tipo: str) -> pd.DataFrame:
             if sub_df.empty:
                 logger.debug(f"DataFrame vazio para tipo {tipo}")
                 return pd.DataFrame()
 
-            df_copy = sub_df.copy()
-            df_copy['BANCO'] = bank_name
-            df_copy['TIPO_ARQUIVO'] = '3026-12'
-            df_copy['AUDITADO_TIPO'] = 'AUD' if tipo == 'aud' else 'NAUD'
-            df_copy['DUPLICADO'] = df_copy['CONTRATO'].duplicated(keep=False)
+            df_copy = sub_df.assign(
+                **_colunas_constantes(
+                    len(sub_df),
+                    BANCO=bank_name,
+                    TIPO_ARQUIVO='3026-12',
+                    AUDITADO_TIPO='AUD' if tipo == 'aud' else 'NAUD',
+                ),
+                # process_3026_12 já deduplicou por CONTRATO dentro de AUD/NAUD: nenhum repete
+                DUPLICADO=False,
+            )
             logger.debug(f"Sub-dataframe preparado ({tipo}): {len(df_copy)} registros")
             return df_copy
 
-        df_aud_processado = preparar_sub_df(df_aud, 'aud')
-        df_naud_processado = preparar_sub_df(df_naud, 'naud')
+        df_aud_processado = preparar_sub_df(df_aud, 'aud') if precisa_aud else pd.DataFrame()
+        df_naud_processado = preparar_sub_df(df_naud, 'naud') if precisa_naud else pd.DataFrame()
 
         # Abas "Últimos 2 Meses" devem existir mesmo quando o filtro do front está desativado.
         mb_periodo = months_back if period_filter_active else 2
@@ -1080,33 +1496,91 @@ def processar_3026_12_com_abas(
         raise
 
 
+def _totais_por_grupo(
+    df: pd.DataFrame, group_cols: list, duplicado: Optional[np.ndarray] = None
+) -> pd.DataFrame:
+    """
+    Totais por grupo (TOTAL_LINHAS, CONTRATOS_UNICOS, CONTRATOS_DUPLICADOS) a partir de
+    códigos inteiros: cada coluna é fatorada uma vez e as contagens saem de np.bincount
+    sobre o código combinado. Grupos na mesma ordem de groupby(dropna=False, observed=True).
+    `duplicado`: máscara por linha somada em CONTRATOS_DUPLICADOS; se None, conta as linhas
+    cujo CONTRATO se repete dentro do grupo (duplicated(keep=False) por grupo).
+    """
+    codigos, rotulos = [], []
+    for col in group_cols:
+        c, u = pd.factorize(df[col], sort=True, use_na_sentinel=False)
+        codigos.append(c)
+        rotulos.append(u)
+    dims = tuple(max(len(u), 1) for u in rotulos)
+    n_grupos = int(np.prod(dims))
+    grupo = np.ravel_multi_index(codigos, dims)
+
+    contrato, contratos_uniq = pd.factorize(df['CONTRATO'], use_na_sentinel=False)
+    n_contratos = max(len(contratos_uniq), 1)
+    pares, pares_uniq = pd.factorize(grupo.astype(np.int64) * n_contratos + contrato)
+
+    total = np.bincount(grupo, minlength=n_grupos)
+    # nunique ignora CONTRATO vazio (NaN)
+    pares_validos = pares_uniq[~pd.isna(contratos_uniq)[pares_uniq % n_contratos]]
+    unicos = np.bincount(pares_validos // n_contratos, minlength=n_grupos)
+    if duplicado is None:
+        duplicado = np.bincount(pares)[pares] > 1
+    duplicados = np.bincount(grupo, weights=duplicado, minlength=n_grupos).astype(np.int64)
+
+    presentes = np.flatnonzero(total)
+    posicoes = np.unravel_index(presentes, dims)
+    summary = pd.DataFrame({col: rotulos[i].take(posicoes[i]) for i, col in enumerate(group_cols)})
+    summary['TOTAL_LINHAS'] = total[presentes]
+    summary['CONTRATOS_UNICOS'] = unicos[presentes]
+    summary['CONTRATOS_DUPLICADOS'] = duplicados[presentes]
+    return summary
+
+
+def _mascara_contratos_repetidos(df_full: pd.DataFrame) -> Optional[np.ndarray]:
+    """
+    Linhas de CONTRATO repetido no escopo, a mesma máscara para a aba "Contratos Repetidos"
+    e para CONTRATOS_DUPLICADOS do "Resumo Geral". DUPLICADO foi marcado em cada arquivo
+    antes dos filtros (AUDITADO, período, habitacional): a marca só vale se outra linha
+    marcada com o mesmo CONTRATO continua no escopo. Sem nenhuma marca válida, cai no
+    CONTRATO repetido no consolidado. None quando não há DUPLICADO nem CONTRATO.
+    """
+    repetido = None
+    if 'DUPLICADO' in df_full.columns:
+        repetido = df_full['DUPLICADO'].to_numpy() == True
+        if repetido.any() and 'CONTRATO' in df_full.columns:
+            # Códigos do factorize: um hash só, sem cópias
+            codigos, uniques = pd.factorize(df_full['CONTRATO'], use_na_sentinel=False)
+            marcados = np.bincount(codigos[repetido], minlength=len(uniques))
+            repetido &= marcados[codigos] > 1
+    if (repetido is None or not repetido.any()) and 'CONTRATO' in df_full.columns:
+        repetido = _contrato_duplicate_masks(df_full['CONTRATO'])[1]
+    return repetido
+
+
 def gerar_resumo_geral(df_full: pd.DataFrame) -> pd.DataFrame:
     if df_full.empty:
         return pd.DataFrame()
 
-    df = df_full.copy()
+    # Só as colunas usadas no resumo, em vez de copiar o consolidado inteiro
+    colunas = [
+        c for c in ['CONTRATO', 'BANCO', 'TIPO_ARQUIVO', 'AUDITADO_TIPO']
+        if c in df_full.columns
+    ]
+    df = df_full[colunas]
     if 'BANCO' in df.columns:
         df['BANCO'] = df['BANCO'].fillna('NÃO INFORMADO')
     else:
         df['BANCO'] = 'NÃO INFORMADO'
-    if 'DUPLICADO' in df.columns:
-        df['DUPLICADO'] = df['DUPLICADO'].fillna(False)
-    else:
-        df['DUPLICADO'] = False
 
     group_cols = ['BANCO', 'TIPO_ARQUIVO']
     if 'AUDITADO_TIPO' in df.columns:
         group_cols.append('AUDITADO_TIPO')
 
-    summary = (
-        df.groupby(group_cols, dropna=False)
-        .agg(
-            TOTAL_LINHAS=('CONTRATO', 'size'),
-            CONTRATOS_UNICOS=('CONTRATO', lambda s: s.nunique()),
-            CONTRATOS_DUPLICADOS=('DUPLICADO', lambda s: int(s.sum()) if not s.empty else 0)
-        )
-        .reset_index()
-    )
+    # Mesma máscara da aba "Contratos Repetidos": os dois números batem no workbook
+    duplicado = _mascara_contratos_repetidos(df_full)
+    if duplicado is None:
+        duplicado = np.zeros(len(df), dtype=bool)
+    summary = _totais_por_grupo(df, group_cols, duplicado=duplicado)
 
     total_row = {
         'BANCO': 'TOTAL GERAL',
@@ -1126,39 +1600,120 @@ def gerar_contratos_repetidos(df_full: pd.DataFrame) -> pd.DataFrame:
     if df_full.empty:
         return pd.DataFrame()
 
-    if 'DUPLICADO' in df_full.columns:
-        df_repetidos = df_full[df_full['DUPLICADO'] == True].copy()
-    else:
-        df_repetidos = df_full[df_full.duplicated(subset=['CONTRATO'], keep=False)].copy()
-
-    if df_repetidos.empty and 'CONTRATO' in df_full.columns:
-        df_repetidos = df_full[df_full.duplicated(subset=['CONTRATO'], keep=False)].copy()
+    repetido = _mascara_contratos_repetidos(df_full)
+    if repetido is None:
+        return pd.DataFrame()
 
-    return df_repetidos.drop_duplicates()
+    return df_full.iloc[np.flatnonzero(repetido)].drop_duplicates()
 
 
 def gerar_contratos_por_banco(df_full: pd.DataFrame) -> pd.DataFrame:
     if df_full.empty:
         return pd.DataFrame()
 
-    df = df_full.copy()
+    df = df_full[[c for c in ['BANCO', 'CONTRATO'] if c in df_full.columns]]
     if 'BANCO' not in df.columns:
         df['BANCO'] = 'NÃO INFORMADO'
     else:
         df['BANCO'] = df['BANCO'].fillna('NÃO INFORMADO')
 
-    summary = (
-        df.groupby('BANCO', dropna=False)
-        .agg(
-            TOTAL_CONTRATOS=('CONTRATO', 'size'),
-            CONTRATOS_UNICOS=('CONTRATO', lambda s: s.nunique()),
-            CONTRATOS_DUPLICADOS=('CONTRATO', lambda s: s.duplicated(keep=False).sum())
-        )
-        .reset_index()
-    )
+    summary = _totais_por_grupo(df, ['BANCO']).rename(columns={'TOTAL_LINHAS': 'TOTAL_CONTRATOS'})
     return summary
 
 
+# Formatos colunares da saída (zip com uma tabela por aba) -> extensão de cada arquivo
+FORMATOS_COLUNARES = {
+    'parquet': 'parquet',
+    'arrow': 'arrow',  # Arrow IPC stream
+    'arrow_file': 'arrow',  # Arrow IPC file (Feather v2): leitura com acesso aleatório / mmap
+}
+FORMATOS_SAIDA = frozenset(FORMATOS_COLUNARES) | {'xlsx'}
+
+# Accept do cliente -> formato de saída (navegador continua recebendo xlsx)
+MEDIA_TYPES_SAIDA = {
+    'application/vnd.apache.parquet': 'parquet',
+    'application/x-parquet': 'parquet',
+    'application/vnd.apache.arrow.stream': 'arrow',
+    'application/vnd.apache.arrow.file': 'arrow_file',
+}
+
+
+def formato_saida_por_accept(accept: Optional[str]) -> str:
+    """Primeiro media type colunar citado no Accept; senão (ou sem pyarrow) 'xlsx'."""
+    if pa is None:
+        return 'xlsx'
+    for parte in (accept or '').split(','):
+        media_type = parte.split(';', 1)[0].strip().lower()
+        if media_type in MEDIA_TYPES_SAIDA:
+            return MEDIA_TYPES_SAIDA[media_type]
+    return 'xlsx'
+
+
+def formato_saida(formato: Optional[str], accept: Optional[str]) -> str:
+    """
+    Formato pedido explicitamente (?format=, atalho para curl e scripts) ou, na falta dele,
+    negociado pelo Accept. Formato colunar explícito sem pyarrow é 406, não xlsx silencioso.
+    """
+    if not formato:
+        return formato_saida_por_accept(accept)
+    formato = formato.strip().lower()
+    if formato not in FORMATOS_SAIDA:
+        raise HTTPException(
+            status_code=400,
+            detail=f"format inválido: '{formato}'. Valores aceitos: {', '.join(sorted(FORMATOS_SAIDA))}"
+        )
+    if formato in FORMATOS_COLUNARES and pa is None:
+        raise HTTPException(
+            status_code=406,
+            detail=f"format '{formato}' indisponível neste servidor (pyarrow não instalado); use xlsx"
+        )
+    return formato
+
+
+# Opções do xlsxwriter para a planilha consolidada: constant_memory mantém só a linha
+# corrente em memória (exige escrita em ordem de linha — ver write_sheet_rows).
+# Texto das planilhas de origem é gravado como texto: nada de virar link ou fórmula.
+XLSXWRITER_OPTIONS = {
+    'constant_memory': True,
+    'strings_to_urls': False,
+    'strings_to_formulas': False,
+    'nan_inf_to_errors': True,
+    'default_date_format': 'dd/mm/yyyy',
+}
+
+# Linhas convertidas por vez em write_sheet_rows
+LINHAS_POR_LOTE = 8192
+
+def _is_excel_date_column(col_name, serie: pd.Series) -> bool:
+    return _is_date_column_name(col_name) or pd.api.types.is_datetime64_any_dtype(serie)
+
+
+def write_sheet_rows(writer, df: pd.DataFrame, sheet_name: str):
+    """
+    Escreve o DataFrame linha a linha com worksheet.write_row (xlsxwriter).
+    O to_excel do pandas grava coluna por coluna, o que não funciona com constant_memory.
+    Colunas de data datetime64 são gravadas sem hora, como em apply_excel_formatting.
+    """
+    workbook = writer.book
+    worksheet = workbook.add_worksheet(sheet_name)
+    header_fmt = workbook.add_format({'bold': True, 'border': 1, 'align': 'center', 'valign': 'top'})
+    worksheet.write_row(0, 0, list(df.columns), header_fmt)
+
+    datas = {
+        col: df[col].dt.normalize()
+        for col in df.columns
+        if pd.api.types.is_datetime64_any_dtype(df[col]) and _is_excel_date_column(col, df[col])
+    }
+    if datas:
+        df = df.assign(**datas)
+    # Conversão para objetos Python em lotes: a cópia object nunca passa de LINHAS_POR_LOTE linhas
+    for inicio in range(0, len(df), LINHAS_POR_LOTE):
+        lote = df.iloc[inicio:inicio + LINHAS_POR_LOTE]
+        valores = lote.astype(object).where(lote.notna(), None)
+        for row_idx, row in enumerate(valores.itertuples(index=False, name=None), start=inicio + 1):
+            worksheet.write_row(row_idx, 0, row)
+
+
 def apply_excel_formatting(writer, df: pd.DataFrame, sheet_name: str):
     """
     Aplica formatação no Excel:
@@ -1166,39 +1721,45 @@ def apply_excel_formatting(writer, df: pd.DataFrame, sheet_name: str):
     - Coluna CONTRATO: formato texto
     """
     worksheet = writer.sheets[sheet_name]
+
+    if hasattr(worksheet, 'set_column'):
+        # xlsxwriter: formato por coluna (células de data já saem com default_date_format)
+        date_fmt = writer.book.add_format({'num_format': 'DD/MM/YYYY'})
+        text_fmt = writer.book.add_format({'num_format': '@'})
+        for idx, col_name in enumerate(df.columns):
+            if _is_excel_date_column(col_name, df.iloc[:, idx]):
+                worksheet.set_column(idx, idx, None, date_fmt)
+        if 'CONTRATO' in df.columns:
+            idx = df.columns.get_loc('CONTRATO')
+            worksheet.set_column(idx, idx, None, text_fmt)
+        if len(df.columns) > 3:
+            worksheet.set_column(3, 3, None, text_fmt)
+        return
     
-    # Lista de possíveis nomes de colunas de data
-    colunas_data_conhecidas = [
-        'DT.ASS.', 'DT.EVENTO', 'DT.HAB.', 'DT.PROC.HAB.',
-        'DT.ASS', 'DT.EVENTO', 'DT.HAB', 'DT.PROC.HAB',
-        'DATA ASS.', 'DATA EVENTO', 'DATA HAB.', 'DATA PROC.HAB.',
-        'DT.BASE', 'DT.TERM.ANALISE', 'DT.MANIFESTACAO', 'DT.POS.NOVACAO',
-        'DT.ULT.AUDITORIA', 'DT.ULT.NEGOCIACAO', 'DATA STATUS'
-    ]
-    
+    # openpyxl: células já gravadas têm estilo próprio (o formato da coluna não se aplica a
+    # elas), então cada célula recebe o formato; iter_rows por coluna evita resolver
+    # coordenadas "A1" célula a célula.
+    ultima_linha = len(df) + 1
+
+    def _celulas(col_idx: int):
+        for (cell,) in worksheet.iter_rows(
+            min_row=2, max_row=ultima_linha, min_col=col_idx, max_col=col_idx
+        ):
+            yield cell
+
     # Formatar colunas de data (nome, dtype datetime ou object com datas)
-    for col_name in df.columns:
-        is_dt_dtype = pd.api.types.is_datetime64_any_dtype(df[col_name])
-        is_date_col = (
-            col_name in colunas_data_conhecidas
-            or str(col_name).upper().startswith('DT.')
-            or str(col_name).upper().startswith('DATA')
-            or is_dt_dtype
-        )
+    for col_idx, col_name in enumerate(df.columns, start=1):
+        is_date_col = _is_excel_date_column(col_name, df.iloc[:, col_idx - 1])
         
         if is_date_col:
             try:
-                col_idx = df.columns.get_loc(col_name) + 1
-                col_letter = get_column_letter(col_idx)
-                for row in range(2, len(df) + 2):
-                    cell = worksheet[f"{col_letter}{row}"]
+                worksheet.column_dimensions[get_column_letter(col_idx)].number_format = 'DD/MM/YYYY'
+                for cell in _celulas(col_idx):
                     v = cell.value
                     if v is not None:
                         try:
                             if isinstance(v, datetime):
                                 cell.value = v.date()
-                            elif isinstance(v, date) and not isinstance(v, datetime):
-                                cell.value = v
                             elif hasattr(v, 'to_pydatetime'):
                                 pd_dt = v.to_pydatetime()
                                 cell.value = pd_dt.date()
@@ -1208,20 +1769,15 @@ def apply_excel_formatting(writer, df: pd.DataFrame, sheet_name: str):
             except Exception as e:
                 logger.warning(f"Erro ao formatar coluna de data {col_name}: {e}")
     
-    # Formatar coluna CONTRATO como texto
+    # Formatar coluna CONTRATO e coluna D (índice 3) como texto
+    colunas_texto = set()
     if 'CONTRATO' in df.columns:
-        col_idx = df.columns.get_loc('CONTRATO') + 1
-        col_letter = get_column_letter(col_idx)
-        for row in range(2, len(df) + 2):
-            cell = worksheet[f"{col_letter}{row}"]
-            cell.number_format = '@'
-    
-    # Formatar coluna D (índice 3) como texto se existir
+        colunas_texto.add(df.columns.get_loc('CONTRATO') + 1)
     if len(df.columns) > 3:
-        col_idx = 4  # Coluna D (1-based)
-        col_letter = get_column_letter(col_idx)
-        for row in range(2, len(df) + 2):
-            cell = worksheet[f"{col_letter}{row}"]
+        colunas_texto.add(4)  # Coluna D (1-based)
+    for col_idx in sorted(colunas_texto):
+        worksheet.column_dimensions[get_column_letter(col_idx)].number_format = '@'
+        for cell in _celulas(col_idx):
             cell.number_format = '@'
 
 
@@ -1253,11 +1809,18 @@ def add_column_ae_sum(writer, df: pd.DataFrame, sheet_name: str):
             soma = valores_numericos.sum()
             
             if pd.notna(soma):
-                # Adicionar rótulo
-                worksheet[f"AD{row_sum}"] = "SOMA AE:"
-                # Adicionar valor da soma
-                worksheet[f"{col_letter}{row_sum}"] = soma
-                worksheet[f"{col_letter}{row_sum}"].number_format = '#,##0.00'
+                if hasattr(worksheet, 'write_number'):
+                    # xlsxwriter (índices 0-based; linha escrita depois dos dados)
+                    worksheet.write_string(row_sum - 1, 29, "SOMA AE:")
+                    worksheet.write_number(
+                        row_sum - 1, 30, float(soma), writer.book.add_format({'num_format': '#,##0.00'})
+                    )
+                else:
+                    # Adicionar rótulo
+                    worksheet[f"AD{row_sum}"] = "SOMA AE:"
+                    # Adicionar valor da soma
+                    worksheet[f"{col_letter}{row_sum}"] = soma
+                    worksheet[f"{col_letter}{row_sum}"].number_format = '#,##0.00'
                 
                 logger.debug(f"Soma da coluna AE adicionada em {sheet_name}: {soma}")
         except Exception as e:
@@ -1267,21 +1830,29 @@ def add_column_ae_sum(writer, df: pd.DataFrame, sheet_name: str):
         logger.warning(f"Erro ao adicionar soma da coluna AE em {sheet_name}: {e}")
 
 
-def save_processed_file(df: pd.DataFrame, filepath: str):
-    """Salva arquivo Excel processado com formatação"""
+def save_processed_file(df: pd.DataFrame, filepath: str, *copias: str):
+    """
+    Salva arquivo Excel processado com formatação.
+    A pasta de destino já deve existir (criada uma vez por requisição em process_contratos).
+    `copias`: outros caminhos com o mesmo conteúdo; o workbook é gerado uma vez e copiado.
+    """
     try:
         filepath_obj = Path(filepath)
-        filepath_obj.parent.mkdir(parents=True, exist_ok=True)
         
         logger.debug(f"Salvando arquivo: {filepath}")
         
-        with pd.ExcelWriter(filepath, engine='openpyxl') as writer:
-            df.to_excel(writer, sheet_name='Dados', index=False)
+        with pd.ExcelWriter(
+            filepath, engine='xlsxwriter', engine_kwargs={'options': XLSXWRITER_OPTIONS}
+        ) as writer:
+            write_sheet_rows(writer, df, 'Dados')
             apply_excel_formatting(writer, df, 'Dados')
         
         if not filepath_obj.exists():
             raise Exception(f"Arquivo não foi salvo: {filepath}")
         
+        for copia in copias:
+            shutil.copyfile(filepath, copia)
+        
         logger.debug(f"Arquivo salvo com sucesso: {filepath}")
         
     except Exception as e:
@@ -1289,6 +1860,811 @@ def save_processed_file(df: pd.DataFrame, filepath: str):
         raise
 
 
+# Planilhas já lidas e preparadas (datas, dtypes, CONTRATO), por hash do conteúdo: o reenvio
+# do mesmo arquivo com outros filtros pula a leitura. Limitado por bytes (memory_usage deep)
+# e não por quantidade: CACHE_PLANILHAS_MB vale para cada processo web; no modo 'process'
+# cada processo do pool tem o próprio cache e fica com uma fração (MB / workers), para o
+# total não multiplicar pelo número de workers. CACHE_PLANILHAS_MB=0 desativa.
+# O isolamento por cópia rasa depende do Copy-on-Write do pandas 3 (requirements: pandas>=3).
+CACHE_PLANILHAS_MB = int(os.getenv('CACHE_PLANILHAS_MB', '256'))
+CACHE_PLANILHAS_TTL = int(os.getenv('CACHE_PLANILHAS_TTL', '1800'))  # segundos
+_CACHE_PLANILHAS: OrderedDict = OrderedDict()  # chave -> (instante, DataFrame, bytes)
+_CACHE_PLANILHAS_BYTES = 0
+_CACHE_PLANILHAS_LOCK = threading.Lock()
+
+
+def _limite_cache_planilhas() -> int:
+    """Bytes do cache em memória deste processo."""
+    limite = CACHE_PLANILHAS_MB * 1024 * 1024
+    if CONTRATOS_EXECUTOR != 'thread':
+        limite //= MAX_WORKERS_CONTRATOS
+    return limite
+
+
+def _planilha_em_cache(chave: str) -> Optional[pd.DataFrame]:
+    global _CACHE_PLANILHAS_BYTES
+    with _CACHE_PLANILHAS_LOCK:
+        item = _CACHE_PLANILHAS.get(chave)
+        if item is None:
+            return None
+        if time.monotonic() - item[0] > CACHE_PLANILHAS_TTL:
+            del _CACHE_PLANILHAS[chave]
+            _CACHE_PLANILHAS_BYTES -= item[2]
+            return None
+        _CACHE_PLANILHAS.move_to_end(chave)
+        # Cópia rasa: com Copy-on-Write as alterações da requisição não chegam ao cache
+        return item[1].copy(deep=False)
+
+
+def _guardar_planilha(chave: str, df: pd.DataFrame) -> None:
+    global _CACHE_PLANILHAS_BYTES
+    limite = _limite_cache_planilhas()
+    if limite <= 0:
+        return
+    tamanho = int(df.memory_usage(index=True, deep=True).sum())
+    if tamanho > limite:
+        logger.debug(f"Planilha {chave} ({tamanho} bytes) maior que o cache em memória")
+        return
+    with _CACHE_PLANILHAS_LOCK:
+        anterior = _CACHE_PLANILHAS.pop(chave, None)
+        if anterior is not None:
+            _CACHE_PLANILHAS_BYTES -= anterior[2]
+        _CACHE_PLANILHAS[chave] = (time.monotonic(), df.copy(deep=False), tamanho)
+        _CACHE_PLANILHAS_BYTES += tamanho
+        while _CACHE_PLANILHAS_BYTES > limite:
+            _chave, (_instante, _df, removido) = _CACHE_PLANILHAS.popitem(last=False)
+            _CACHE_PLANILHAS_BYTES -= removido
+
+
+# Segundo nível do cache, em disco (Feather/Arrow IPC, zstd): sobrevive a restart e é
+# compartilhado entre os processos do pool. Opcional e desligado por padrão: exige pyarrow
+# (fora do requirements.txt) e CACHE_PLANILHAS_DISCO_MB > 0. Os arquivos têm dados de
+# contratos de clientes: o diretório é privado (0o700, do próprio usuário; caso contrário o
+# cache em disco não é usado) e cada arquivo vive no máximo CACHE_PLANILHAS_DISCO_TTL
+# segundos desde a gravação, além do limite de tamanho (LRU pelo último acesso).
+CACHE_PLANILHAS_DIR = os.getenv(
+    'CACHE_PLANILHAS_DIR', os.path.join(tempfile.gettempdir(), 'leitorback_planilhas')
+)
+CACHE_PLANILHAS_DISCO_MB = int(os.getenv('CACHE_PLANILHAS_DISCO_MB', '0'))
+CACHE_PLANILHAS_DISCO_TTL = int(os.getenv('CACHE_PLANILHAS_DISCO_TTL', '3600'))  # segundos
+_DIRETORIO_CACHE_OK: Optional[bool] = None  # verificado uma vez por processo
+
+
+def _diretorio_cache_privado() -> bool:
+    """
+    Cria o diretório do cache com permissão 0o700 e confere que é um diretório de verdade
+    (não link), do usuário do processo e sem acesso de grupo/outros. Um diretório criado
+    antes por outro usuário (ex.: no /tmp compartilhado) desativa o cache em disco.
+    """
+    global _DIRETORIO_CACHE_OK
+    if _DIRETORIO_CACHE_OK is None:
+        try:
+            os.makedirs(CACHE_PLANILHAS_DIR, mode=0o700, exist_ok=True)
+            info = os.lstat(CACHE_PLANILHAS_DIR)
+            problema = None
+            if not stat.S_ISDIR(info.st_mode):
+                problema = "não é um diretório"
+            elif hasattr(os, 'getuid') and info.st_uid != os.getuid():
+                problema = "pertence a outro usuário"
+            elif hasattr(os, 'getuid') and info.st_mode & 0o077:
+                problema = "permite acesso de grupo/outros"
+            if problema:
+                logger.warning(
+                    f"Cache em disco desativado: {CACHE_PLANILHAS_DIR} {problema}"
+                )
+            _DIRETORIO_CACHE_OK = problema is None
+        except OSError as e:
+            logger.warning(f"Cache em disco desativado: {CACHE_PLANILHAS_DIR} inacessível ({e})")
+            _DIRETORIO_CACHE_OK = False
+    return _DIRETORIO_CACHE_OK
+
+
+def _caminho_planilha_em_disco(chave: str) -> Optional[str]:
+    global _DIRETORIO_CACHE_OK
+    if CACHE_PLANILHAS_DISCO_MB <= 0:
+        return None
+    if pa is None:
+        if _DIRETORIO_CACHE_OK is None:
+            logger.warning("CACHE_PLANILHAS_DISCO_MB definido, mas pyarrow não está instalado")
+            _DIRETORIO_CACHE_OK = False
+        return None
+    if not _diretorio_cache_privado():
+        return None
+    return os.path.join(CACHE_PLANILHAS_DIR, f"{chave}.arrow")
+
+
+def _remover_do_disco(caminho: str) -> None:
+    try:
+        os.unlink(caminho)
+    except OSError:
+        pass
+
+
+def _planilha_em_disco(chave: str) -> Optional[pd.DataFrame]:
+    caminho = _caminho_planilha_em_disco(chave)
+    if caminho is None:
+        return None
+    try:
+        info = os.stat(caminho)
+    except OSError:
+        return None
+    if time.time() - info.st_mtime > CACHE_PLANILHAS_DISCO_TTL:
+        _remover_do_disco(caminho)
+        return None
+    try:
+        df = pd.read_feather(caminho)
+        # atime = último uso (ordem do LRU); mtime fica = gravação (base do TTL)
+        os.utime(caminho, (time.time(), info.st_mtime))
+        return df
+    except Exception as e:
+        logger.warning(f"Cache em disco ilegível ({caminho}), descartado: {e}")
+        _remover_do_disco(caminho)
+        return None
+
+
+def _guardar_planilha_em_disco(chave: str, df: pd.DataFrame) -> None:
+    """
+    Grava a planilha preparada em Feather. Só fica no cache se a leitura de volta reproduz as
+    mesmas colunas e dtypes (colunas object com tipos misturados ou nomes não texto ficam de
+    fora: o Arrow mudaria os valores).
+    """
+    caminho = _caminho_planilha_em_disco(chave)
+    if caminho is None:
+        return
+    temporario = f"{caminho}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        df.to_feather(temporario, compression='zstd')
+        lido = pd.read_feather(temporario)
+        if list(lido.columns) != list(df.columns) or not lido.dtypes.equals(df.dtypes):
+            logger.debug(f"Planilha {chave} não cabe no cache em disco sem mudar dtypes")
+            _remover_do_disco(temporario)
+            return
+        # Troca atômica: outro processo do pool nunca lê um arquivo pela metade
+        os.replace(temporario, caminho)
+    except Exception as e:
+        logger.debug(f"Planilha {chave} fora do cache em disco: {e}")
+        _remover_do_disco(temporario)
+        return
+    _limitar_cache_em_disco()
+
+
+def _limitar_cache_em_disco() -> None:
+    """
+    Remove os arquivos vencidos (CACHE_PLANILHAS_DISCO_TTL desde a gravação) e depois os usados
+    há mais tempo até o diretório caber em CACHE_PLANILHAS_DISCO_MB.
+    """
+    agora = time.time()
+    arquivos = []
+    try:
+        for entrada in os.scandir(CACHE_PLANILHAS_DIR):
+            if not (entrada.is_file(follow_symlinks=False) and entrada.name.endswith('.arrow')):
+                continue
+            info = entrada.stat(follow_symlinks=False)
+            if agora - info.st_mtime > CACHE_PLANILHAS_DISCO_TTL:
+                _remover_do_disco(entrada.path)
+            else:
+                arquivos.append((info.st_atime, info.st_size, entrada.path))
+    except OSError:
+        return
+    excesso = sum(tamanho for _, tamanho, _ in arquivos) - CACHE_PLANILHAS_DISCO_MB * 1024 * 1024
+    for _, tamanho, caminho in sorted(arquivos):
+        if excesso <= 0:
+            break
+        _remover_do_disco(caminho)
+        excesso -= tamanho
+
+
+def _processar_arquivo_contratos(
+    conteudo,
+    filename: str,
+    file_type: str,
+    filter_type: str,
+    bank_name: str,
+    bank_type_normalized: str,
+    base_dir: Path,
+    filtragem_dir: Path,
+    period_filter_active: bool,
+    reference_date: Optional[str],
+    months_back: int,
+    habitacional_filter_active: bool,
+    habitacional_reference_date: Optional[str],
+    habitacional_months_back: int,
+    chave_cache: Optional[str] = None,
+) -> dict:
+    """
+    Processa um único arquivo enviado (código pandas síncrono, executado no pool de processos).
+    `conteudo` é o caminho do Excel em disco (ou bytes / objeto arquivo).
+    `chave_cache`: hash do conteúdo; quando presente, a planilha lida é reaproveitada do cache.
+    Não altera estado compartilhado: devolve as partes a consolidar e os arquivos
+    a salvar no arquivo morto, que são gravados depois de todos os arquivos.
+    As partes são pares (rótulo, DataFrame); o rótulo diz de que recorte do arquivo
+    a parte veio ('3026-11', '3026-15' ou a aba do 3026-12) e é o que liga uma aba
+    aos contratos consolidados em _concat_aba.
+    """
+    resultado = {
+        'contratos': [],
+        'abas': {'3026-11': [], '3026-15': []},
+        'dados_3026_12': {
+            'todos': [],
+            'auditados': [],
+            'naud': [],
+            'todos_ultimos_2_meses': [],
+            'auditados_ultimos_2_meses': [],
+            'naud_ultimos_2_meses': []
+        },
+        'tem_3026_12': False,
+        'arquivos': [],  # (DataFrame, caminho) para o arquivo morto
+    }
+    
+    filename = filename or ""
+    
+    logger.info(f"\n{'='*60}")
+    logger.info(f"📄 PROCESSANDO ARQUIVO: {filename}")
+    logger.info(f"{'='*60}")
+    
+    # Filtrar por tipo de arquivo se especificado
+    if not arquivo_do_tipo(filename, file_type):
+        logger.debug(f"Arquivo {filename} ignorado (não é {file_type})")
+        return resultado
+    
+    df = _planilha_em_cache(chave_cache) if chave_cache else None
+    if df is None and chave_cache:
+        df = _planilha_em_disco(chave_cache)
+        if df is not None:
+            _guardar_planilha(chave_cache, df)
+    if df is not None:
+        logger.info(f"♻️  Arquivo já lido antes (cache): {len(df)} linhas, {len(df.columns)} colunas")
+    else:
+        # Ler arquivo
+        try:
+            df = _read_excel_fast(conteudo)
+            logger.info(f"✅ Arquivo lido: {len(df)} linhas, {len(df.columns)} colunas")
+        except Exception as e:
+            logger.error(f"❌ Erro ao ler arquivo {filename}: {e}")
+            # Detalhe da exceção só no log; o cliente recebe uma mensagem fixa
+            raise HTTPException(
+                status_code=400,
+                detail=f"Erro ao ler arquivo {filename}: arquivo Excel inválido ou corrompido"
+            )
+        
+        # Formatação de datas
+        df = format_date_columns(df)
+        df = format_object_columns_that_look_like_dates(df)
+        df = optimize_dtypes(df)
+        
+        # Remover colunas gerais
+        df = remove_general_columns(df)
+        
+        # Formatação da coluna CONTRATO
+        df = format_contrato_column(df)
+
+        if chave_cache:
+            _guardar_planilha(chave_cache, df)
+            _guardar_planilha_em_disco(chave_cache, df)
+    
+    # Detectar tipo de arquivo
+    detected_file_type = detect_file_type(filename)
+    logger.info(f"Tipo detectado: {detected_file_type}")
+    
+    if detected_file_type == '3026-11':
+        df_processado, total_linhas, total_unicos, total_duplicados, duplicado = process_3026_11(df, bank_name)
+
+        if df_processado.empty:
+            logger.warning(f"⚠️  Arquivo {filename} resultou em DataFrame vazio")
+            return resultado
+
+        df_processado = df_processado.assign(
+            **_colunas_constantes(len(df_processado), TIPO_ARQUIVO='3026-11', BANCO=bank_name),
+            DUPLICADO=duplicado,
+        )
+
+        df_processado = filtrar_dataframe_por_tipo_auditado(df_processado, filter_type)
+
+        # ✅ APLICAR FILTRO HABITACIONAL (NOVO)
+        if habitacional_filter_active:
+            logger.info(f"\n✅ APLICANDO FILTRO HABITACIONAL PARA 3026-11")
+            df_processado = filtrar_planilha_contratos(
+                df_processado,
+                aplicar_periodo=False,
+                aplicar_habitacional=True,
+                reference_date=habitacional_reference_date,
+                months_back=habitacional_months_back,
+                bank_type=bank_type_normalized
+            )
+            logger.info(f"✅ Filtro habitacional aplicado: {len(df_processado)} registros")
+
+        # Filtro de período
+        if period_filter_active:
+            logger.info(f"\n📅 APLICANDO FILTRO DE PERÍODO")
+            df_processado = filtrar_planilha_contratos(
+                df_processado,
+                aplicar_periodo=True,
+                reference_date=reference_date,
+                months_back=months_back,
+                bank_type=bank_type_normalized
+            )
+
+        resultado['contratos'].append(('3026-11', df_processado))
+        resultado['abas']['3026-11'].append(('3026-11', df_processado))
+
+        n_arquivo = int(df_processado['CONTRATO'].nunique()) if 'CONTRATO' in df_processado.columns else len(df_processado)
+        save_filename = f"3026-11 - {bank_name} - {n_arquivo} (CONTRATOS).xlsx"
+        save_filepath = base_dir / save_filename
+        resultado['arquivos'].append((df_processado, str(save_filepath)))
+
+        if 'AUDITADO' in df_processado.columns:
+            filepath_filtragem = filtragem_dir / save_filename
+            resultado['arquivos'].append((df_processado, str(filepath_filtragem)))
+        
+        logger.info(f"✅ 3026-11 processado: {len(df_processado)} registros finais")
+
+    elif detected_file_type == '3026-15':
+        df_processado, total_linhas, total_unicos, total_duplicados, duplicado = process_3026_15(df, bank_name)
+
+        if df_processado.empty:
+            logger.warning(f"⚠️  Arquivo {filename} resultou em DataFrame vazio")
+            return resultado
+
+        df_processado = df_processado.assign(
+            **_colunas_constantes(len(df_processado), TIPO_ARQUIVO='3026-15', BANCO=bank_name),
+            DUPLICADO=duplicado,
+        )
+
+        df_processado = filtrar_dataframe_por_tipo_auditado(df_processado, filter_type)
+
+        if period_filter_active:
+            logger.info(f"\n📅 APLICANDO FILTRO DE PERÍODO")
+            df_processado = filtrar_planilha_contratos(
+                df_processado,
+                aplicar_periodo=True,
+                reference_date=reference_date,
+                months_back=months_back,
+                bank_type=bank_type_normalized
+            )
+
+        resultado['contratos'].append(('3026-15', df_processado))
+        resultado['abas']['3026-15'].append(('3026-15', df_processado))
+
+        n_arquivo = int(df_processado['CONTRATO'].nunique()) if 'CONTRATO' in df_processado.columns else len(df_processado)
+        save_filename = f"3026-15 - {bank_name} - {n_arquivo} (CONTRATOS).xlsx"
+        save_filepath = base_dir / save_filename
+        resultado['arquivos'].append((df_processado, str(save_filepath)))
+
+        if 'AUDITADO' in df_processado.columns:
+            filepath_filtragem = filtragem_dir / save_filename
+            resultado['arquivos'].append((df_processado, str(filepath_filtragem)))
+        
+        logger.info(f"✅ 3026-15 processado: {len(df_processado)} registros finais")
+
+    elif detected_file_type == '3026-12':
+        logger.info(f"🔧 Processando 3026-12...")
+        
+        resultados = processar_3026_12_com_abas(
+            df,
+            bank_name,
+            bank_type_normalized,
+            period_filter_active,
+            reference_date,
+            months_back,
+            filter_type=filter_type
+        )
+        abas = resultados['abas']
+        stats = resultados['stats']
+        resultado['tem_3026_12'] = True
+
+        logger.info(f"📋 Abas disponíveis: {list(abas.keys())}")
+        logger.info(f"📌 Escopo 3026-12 alinhado a filter_type={filter_type!r}")
+
+        chaves_para_dados = {
+            'todos': 'todos',
+            'aud': 'auditados',
+            'naud': 'naud',
+            'auditados_ultimos_2_meses': 'auditados_ultimos_2_meses',
+            'naud_ultimos_2_meses': 'naud_ultimos_2_meses',
+            'todos_ultimos_2_meses': 'todos_ultimos_2_meses'
+        }
+
+        for chave_aba, chave_dados in chaves_para_dados.items():
+            redirect = _effective_aba_key_3026_12(chave_dados, filter_type)
+            if redirect == '__skip__':
+                continue
+            aba_ler = chave_aba if redirect is None else redirect
+            if aba_ler not in abas:
+                continue
+            subset = abas[aba_ler]
+            if not subset.empty:
+                logger.info(f"   Adicionando {chave_dados} (aba={aba_ler}): {len(subset)} registros")
+                resultado['dados_3026_12'][chave_dados].append((aba_ler, subset))
+            else:
+                logger.debug(f"   {chave_dados} está vazio")
+
+        # Processar AUD e NAUD para salvar arquivos individuais e contratos consolidados
+        for tipo_label, subset_key_aba, subset_key_stats, subset_key_periodo in [
+            ('AUD', 'aud', 'aud', 'auditados_ultimos_2_meses'),
+            ('NAUD', 'naud', 'naud', 'naud_ultimos_2_meses')
+        ]:
+            if filter_type == 'auditado' and subset_key_aba == 'naud':
+                continue
+            if filter_type == 'nauditado' and subset_key_aba == 'aud':
+                continue
+            df_subset = abas.get(subset_key_aba)
+            if df_subset is None or df_subset.empty:
+                logger.warning(f"   ⚠️  Subset {tipo_label} está vazio ou não existe")
+                continue
+
+            logger.info(f"   Processando {tipo_label}: {len(df_subset)} registros")
+
+            # Adicionar aos contratos consolidados (sem filtro adicional para não duplicar)
+            resultado['contratos'].append((subset_key_aba, df_subset))
+
+            # Para salvar, aplicar filtro se necessário
+            df_para_salvar = df_subset
+            
+            if period_filter_active:
+                # Com o filtro ativo, a aba de período do subset é exatamente este recorte
+                # (mesma referência e meses): reaproveitar em vez de reprocessar as datas
+                logger.info(f"      Aplicando filtro de período em {tipo_label}...")
+                df_para_salvar = abas.get(subset_key_periodo)
+                if df_para_salvar is None:
+                    df_para_salvar = filtrar_planilha_contratos(
+                        df_subset,
+                        aplicar_periodo=True,
+                        reference_date=reference_date,
+                        months_back=months_back,
+                        bank_type=bank_type_normalized
+                    )
+                logger.info(f"      {tipo_label} após filtro: {len(df_para_salvar)} registros")
+
+            total_unicos = _stats_total_unicos(stats, subset_key_stats)
+            if total_unicos <= 0 and 'CONTRATO' in df_subset.columns:
+                total_unicos = int(df_subset['CONTRATO'].nunique())
+            save_filename = f"3026-12 - {bank_name} - {tipo_label} - {total_unicos} (CONTRATOS).xlsx"
+            save_filepath = base_dir / save_filename
+
+            if not df_para_salvar.empty:
+                logger.info(f"      Salvando {tipo_label}: {save_filename}")
+                resultado['arquivos'].append((df_para_salvar, str(save_filepath)))
+                filepath_filtragem = filtragem_dir / save_filename
+                resultado['arquivos'].append((df_para_salvar, str(filepath_filtragem)))
+            else:
+                logger.warning(f"      ⚠️  {tipo_label} vazio após filtragem, não salvando arquivo")
+        
+        logger.info(f"✅ 3026-12 processado com sucesso")
+    
+    return resultado
+
+
+# Tamanho dos blocos enviados na resposta
+TAMANHO_BLOCO_RESPOSTA = 1024 * 1024
+
+
+def iterar_em_blocos(buffer: io.BytesIO, tamanho: int = TAMANHO_BLOCO_RESPOSTA):
+    """
+    Conteúdo do buffer em blocos de tamanho fixo para o StreamingResponse. Iterar o BytesIO
+    direto separa por '\n': num xlsx/zip (binário) isso dá dezenas de milhares de pedaços
+    minúsculos, cada um uma ida ao threadpool do Starlette.
+    """
+    while bloco := buffer.read(tamanho):
+        yield bloco
+    buffer.close()
+
+
+def escrever_xlsx_consolidado(abas_saida: list) -> io.BytesIO:
+    """Workbook consolidado: abas (nome, df, formatar, soma AE) em ordem, via xlsxwriter."""
+    output = io.BytesIO()
+    with pd.ExcelWriter(
+        output, engine='xlsxwriter', engine_kwargs={'options': XLSXWRITER_OPTIONS}
+    ) as writer:
+        for nome, df_aba, formatar, soma_ae in abas_saida:
+            write_sheet_rows(writer, df_aba, nome)
+            if formatar:
+                apply_excel_formatting(writer, df_aba, nome)
+            if soma_ae:
+                add_column_ae_sum(writer, df_aba, nome)
+    # Resetar ponteiro: o próprio buffer é enviado, sem copiar os bytes
+    output.seek(0)
+    return output
+
+
+def _tabela_arrow(df: pd.DataFrame):
+    """DataFrame -> pyarrow.Table; colunas object com tipos misturados viram texto."""
+    try:
+        return pa.Table.from_pandas(df, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        mistas = {
+            col: df[col].astype('string')
+            for col in df.columns
+            if df[col].dtype == object
+        }
+        return pa.Table.from_pandas(df.assign(**mistas), preserve_index=False)
+
+
+def escrever_zip_colunar(abas_saida: list, formato: str) -> io.BytesIO:
+    """
+    Mesmas abas do workbook, uma tabela por arquivo dentro de um zip (Parquet ou Arrow IPC
+    stream/file, compressão zstd). Bem mais leve de gerar e de transferir que o xlsx.
+    """
+    output = io.BytesIO()
+    extensao = FORMATOS_COLUNARES[formato]
+    with zipfile.ZipFile(output, 'w', compression=zipfile.ZIP_STORED) as zf:
+        for posicao, (nome, df_aba, _formatar, _soma_ae) in enumerate(abas_saida, start=1):
+            tabela = _tabela_arrow(df_aba)
+            sink = pa.BufferOutputStream()
+            if formato == 'parquet':
+                pq.write_table(tabela, sink, compression='zstd')
+            else:
+                opcoes = pa.ipc.IpcWriteOptions(compression='zstd')
+                abrir = pa.ipc.new_file if formato == 'arrow_file' else pa.ipc.new_stream
+                with abrir(sink, tabela.schema, options=opcoes) as escritor:
+                    escritor.write_table(tabela)
+            zf.writestr(f"{posicao:02d} - {nome}.{extensao}", sink.getvalue().to_pybytes())
+    output.seek(0)
+    return output
+
+
+def _concat_aba(partes: list, partes_contratos: list, df_full: pd.DataFrame) -> pd.DataFrame:
+    """
+    Junta as partes de uma aba. `partes` e `partes_contratos` são pares
+    ((índice do arquivo, rótulo), DataFrame); df_full é o concat de partes_contratos.
+    Quando as chaves das partes são chaves consecutivas dos contratos, com o mesmo número
+    de linhas e as mesmas colunas e dtypes do consolidado, devolve a fatia de df_full
+    (view, sem copiar de novo); caso contrário faz o concat normal.
+    """
+    frames = [df for _chave, df in partes]
+    if len(partes) > 1 and list(df_full.columns) == list(frames[0].columns):
+        chaves = [chave for chave, _df in partes_contratos]
+        try:
+            inicio = chaves.index(partes[0][0])
+        except ValueError:
+            inicio = -1
+        consecutivas = partes_contratos[inicio:inicio + len(partes)] if inicio >= 0 else []
+        mesmas_partes = (
+            [chave for chave, _df in consecutivas] == [chave for chave, _df in partes]
+            and all(len(a) == len(b) for (_c, a), b in zip(consecutivas, frames))
+        )
+        mesmos_dtypes = mesmas_partes and all(
+            list(parte.columns) == list(df_full.columns)
+            and all(
+                parte[col].dtype == df_full[col].dtype
+                for col in df_full.columns
+                if col != 'CONTRATO'  # category no consolidado; valores gravados iguais
+            )
+            for parte in frames
+        )
+        if mesmos_dtypes:
+            linha = sum(len(df) for _chave, df in partes_contratos[:inicio])
+            total = sum(len(df) for df in frames)
+            return df_full.iloc[linha:linha + total].reset_index(drop=True)
+    return pd.concat(frames, ignore_index=True)
+
+
+class _DestinoComHash:
+    """Destino do shutil.copyfileobj que grava no arquivo e atualiza o hash do conteúdo."""
+
+    def __init__(self, destino):
+        self.destino = destino
+        self.digest = hashlib.blake2b(digest_size=16)
+
+    def write(self, bloco) -> int:
+        self.digest.update(bloco)
+        return self.destino.write(bloco)
+
+
+def _copiar_upload_para_temp(arquivo) -> tuple:
+    """
+    Copia o upload (SpooledTemporaryFile do Starlette) para um arquivo temporário em disco
+    com shutil.copyfileobj em blocos de 1 MiB, sem montar o conteúdo inteiro em bytes. O hash
+    do conteúdo (chave do cache de planilhas) é calculado na mesma passada.
+    Devolve (caminho, hash); quem chama apaga.
+    """
+    arquivo.seek(0)
+    with tempfile.NamedTemporaryFile(suffix='.xlsx', delete=False) as tmp:
+        destino = _DestinoComHash(tmp)
+        shutil.copyfileobj(arquivo, destino, 1 << 20)
+    return tmp.name, destino.digest.hexdigest()
+
+
+def _processar_arquivo_em_processo(*args) -> dict:
+    """
+    Ponto de entrada no pool de processos. HTTPException não volta intacta via pickle,
+    então é devolvida como dado e relançada no processo principal.
+    """
+    try:
+        return _processar_arquivo_contratos(*args)
+    except HTTPException as e:
+        return {'http_error': (e.status_code, e.detail)}
+
+
+_PROCESS_EXECUTOR: Optional[Executor] = None
+
+# Cópias individuais em arquivo_morto/ (padrão: ligado). SAVE_ARCHIVE=false desativa.
+SAVE_ARCHIVE = os.getenv('SAVE_ARCHIVE', 'true').strip().lower() not in ('0', 'false', 'no', 'nao', 'não')
+
+# Pool dos arquivos: 'process' (padrão, contorna o GIL) ou 'thread' (sem fork nem pickle dos
+# DataFrames; útil em hosts com pouca memória, já que calamine/pandas liberam o GIL no C/Rust).
+CONTRATOS_EXECUTOR = os.getenv('CONTRATOS_EXECUTOR', 'process').strip().lower()
+
+# Teto de workers do pool: cada worker guarda um DataFrame inteiro em memória, então
+# máquinas com muitos núcleos não abrem dezenas
+MAX_WORKERS_CONTRATOS = min(8, os.cpu_count() or 1)
+
+# Arquivos processados ao mesmo tempo somando todas as requisições (um semáforo global,
+# não um por requisição): o pico de memória fica em N × tamanho médio da planilha, e não no
+# total enviado por vários uploads simultâneos. Limitado ao tamanho do pool, para que o
+# semáforo seja o único ponto de espera (acima disso as tarefas só esperariam no pool)
+MAX_PARSE_CONCURRENCY = max(
+    1, min(int(os.getenv('MAX_PARSE_CONCURRENCY', '4')), MAX_WORKERS_CONTRATOS)
+)
+_PARSE_SEM: Optional[asyncio.Semaphore] = None
+_PARSE_SEM_LOOP: Optional[asyncio.AbstractEventLoop] = None
+
+
+# Limites de upload (MB): por requisição no middleware do main.py (Content-Length antes de
+# receber o corpo, ou contagem dos bytes enquanto chegam) e por arquivo (UploadFile.size)
+MAX_UPLOAD_MB = int(os.getenv('MAX_UPLOAD_MB', '200'))
+MAX_REQUEST_MB = int(os.getenv('MAX_REQUEST_MB', '500'))
+
+
+def verificar_tamanho_upload(file: UploadFile) -> None:
+    """
+    413 para arquivo acima de MAX_UPLOAD_MB. UploadFile.size só existe depois de o Starlette
+    receber o corpo inteiro: isto evita ler e processar o arquivo, não recebê-lo (o teto do
+    recebimento é o MAX_REQUEST_MB do middleware).
+    """
+    if file.size is not None and file.size > MAX_UPLOAD_MB * 1024 * 1024:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Arquivo {file.filename} muito grande (limite de {MAX_UPLOAD_MB} MB)"
+        )
+
+
+def _semaforo_leitura() -> asyncio.Semaphore:
+    """Semáforo global de leitura, recriado se o event loop mudar (ex.: TestClient)."""
+    global _PARSE_SEM, _PARSE_SEM_LOOP
+    loop = asyncio.get_running_loop()
+    if _PARSE_SEM is None or _PARSE_SEM_LOOP is not loop:
+        _PARSE_SEM = asyncio.Semaphore(MAX_PARSE_CONCURRENCY)
+        _PARSE_SEM_LOOP = loop
+    return _PARSE_SEM
+
+
+def _remover_temporario(caminho: str) -> None:
+    try:
+        os.unlink(caminho)
+    except OSError:
+        pass
+
+
+# Aquecimento concluído neste processo (o do servidor ou cada worker do pool)
+_LEITURA_AQUECIDA = False
+
+
+def aquecer_leitura_excel() -> None:
+    """
+    Grava e lê uma planilha de uma célula (xlsxwriter + calamine), para que imports
+    preguiçosos dos engines não caiam na primeira requisição. Falha aqui só gera aviso.
+    """
+    global _LEITURA_AQUECIDA
+    try:
+        inicio = time.perf_counter()
+        buffer = escrever_xlsx_consolidado([('A', pd.DataFrame({'A': [1]}), False, False)])
+        _read_excel_fast(buffer)
+        buffer.seek(0)
+        pd.read_excel(buffer, engine='calamine' if CalamineWorkbook is not None else 'openpyxl')
+        logger.debug(f"Leitura/escrita de Excel aquecida em {time.perf_counter() - inicio:.3f}s")
+        _LEITURA_AQUECIDA = True
+    except Exception as e:
+        logger.warning(f"Aquecimento da leitura de Excel falhou: {e}")
+
+
+def _inicializar_worker(nivel_log: int = logging.INFO) -> None:
+    """
+    Processo do pool: o main.py não roda aqui (forkserver/spawn), então o worker loga direto
+    no console, no nível do processo principal. Os engines do Excel são aquecidos no próprio
+    worker (com forkserver o módulo já vem importado do servidor, e isso é barato); como
+    iniciar_process_executor() sobe os workers no lifespan, isso acontece antes do 1º request.
+    """
+    raiz = logging.getLogger()
+    if not raiz.handlers or any(isinstance(h, logging.handlers.QueueHandler) for h in raiz.handlers):
+        console = logging.StreamHandler()
+        console.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+        raiz.handlers = [console]
+    raiz.setLevel(nivel_log)
+    aquecer_leitura_excel()
+
+
+def _contexto_pool():
+    """
+    Processos do pool nascem do forkserver (ou spawn, onde não existe): o processo web já tem
+    threads (listener do log, event loop, threadpool), e fork com threads pode herdar locks
+    presos. O forkserver pré-importa este módulo, então cada worker já nasce com pandas.
+    """
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        contexto = multiprocessing.get_context('forkserver')
+        contexto.set_forkserver_preload([__name__])
+        return contexto
+    return multiprocessing.get_context('spawn')
+
+
+def get_process_executor() -> Executor:
+    """Pool para o trabalho pandas/openpyxl de cada arquivo, criado sob demanda."""
+    global _PROCESS_EXECUTOR
+    if _PROCESS_EXECUTOR is None:
+        if CONTRATOS_EXECUTOR == 'thread':
+            _PROCESS_EXECUTOR = ThreadPoolExecutor(
+                max_workers=MAX_WORKERS_CONTRATOS, thread_name_prefix='contratos'
+            )
+        else:
+            _PROCESS_EXECUTOR = ProcessPoolExecutor(
+                max_workers=MAX_WORKERS_CONTRATOS,
+                mp_context=_contexto_pool(),
+                initializer=_inicializar_worker,
+                initargs=(logging.getLogger().getEffectiveLevel(),),
+            )
+    return _PROCESS_EXECUTOR
+
+
+def _worker_pronto() -> Tuple[int, bool]:
+    return os.getpid(), _LEITURA_AQUECIDA
+
+
+def iniciar_process_executor() -> Executor:
+    """
+    Cria o pool e já sobe os workers: o ProcessPoolExecutor só cria processos no submit, então
+    sem isto o primeiro usuário pagaria a criação (e o initializer) de cada worker. Um job
+    vazio por worker, enviados de uma vez, antes que algum fique livre para reaproveitar.
+    """
+    executor = get_process_executor()
+    if isinstance(executor, ProcessPoolExecutor):
+        inicio = time.perf_counter()
+        futuros = [executor.submit(_worker_pronto) for _ in range(MAX_WORKERS_CONTRATOS)]
+        workers = dict(futuro.result() for futuro in futuros)
+        logger.info(f"Pool de processos pronto: {len(workers)} workers em {time.perf_counter() - inicio:.2f}s")
+        if not all(workers.values()):
+            logger.warning("Leitura de Excel não aquecida em algum worker: o 1º arquivo nele pagará os imports")
+    return executor
+
+
+def shutdown_process_executor() -> None:
+    """
+    Encerra o pool de processos (chamado no shutdown da aplicação).
+    Gravações do arquivo morto ainda na fila terminam antes do encerramento.
+    """
+    global _PROCESS_EXECUTOR
+    if _PROCESS_EXECUTOR is not None:
+        _PROCESS_EXECUTOR.shutdown(wait=True)
+        _PROCESS_EXECUTOR = None
+
+
+def _descartar_executor_quebrado(executor: Executor) -> None:
+    """
+    Um worker morto (ex.: OOM killer) deixa o pool quebrado para sempre: todo submit seguinte
+    levanta BrokenProcessPool. Encerra sem esperar e zera a referência para o próximo
+    get_process_executor() criar outro; se outra requisição já trocou o pool, o novo fica.
+    """
+    global _PROCESS_EXECUTOR
+    if _PROCESS_EXECUTOR is executor:
+        _PROCESS_EXECUTOR = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+# Referências fortes às gravações em segundo plano (o event loop só guarda referência fraca)
+_TAREFAS_ARQUIVO_MORTO: set = set()
+
+
+def _fim_arquivo_morto(tarefa: asyncio.Future) -> None:
+    _TAREFAS_ARQUIVO_MORTO.discard(tarefa)
+    if not tarefa.cancelled() and tarefa.exception() is not None:
+        logger.error(f"Erro ao salvar arquivo morto em segundo plano: {tarefa.exception()}")
+
+
+def _agendar_arquivo_morto(futuro) -> asyncio.Future:
+    tarefa = asyncio.ensure_future(futuro)
+    _TAREFAS_ARQUIVO_MORTO.add(tarefa)
+    tarefa.add_done_callback(_fim_arquivo_morto)
+    return tarefa
+
+
 async def process_contratos(
     files: List[UploadFile],
     bank_type: str,
@@ -1299,7 +2675,11 @@ async def process_contratos(
     months_back: int = 2,
     habitacional_filter_enabled: str = "false",  # ✅ NOVO PARÂMETRO
     habitacional_reference_date: Optional[str] = None,  # ✅ NOVO PARÂMETRO
-    habitacional_months_back: int = 2             # ✅ NOVO PARÂMETRO
+    habitacional_months_back: int = 2,            # ✅ NOVO PARÂMETRO
+    save_archive: Optional[bool] = None,
+    wait_for_archive: bool = False,
+    output_format: str = 'xlsx',
+    use_cache: bool = True
 ) -> StreamingResponse:
     """
     ✅ CORRIGIDO: Processa múltiplas planilhas Excel de contratos.
@@ -1316,9 +2696,14 @@ async def process_contratos(
         habitacional_filter_enabled: "true" ou "false" - Ativa filtro habitacional (NOVO)
         habitacional_reference_date: Data de referência para filtro habitacional (NOVO)
         habitacional_months_back: Número de meses para filtro habitacional (NOVO)
+        save_archive: Salvar cópias individuais em arquivo_morto/ (None = variável SAVE_ARCHIVE)
+        wait_for_archive: Esperar a gravação do arquivo morto antes de responder (padrão: em segundo plano)
+        output_format: "xlsx" (padrão), "parquet", "arrow" ou "arrow_file" (zip com uma tabela por aba;
+            exige pyarrow)
+        use_cache: Reaproveitar planilhas já lidas com o mesmo conteúdo (False = sempre ler de novo)
     
     Returns:
-        StreamingResponse com arquivo Excel consolidado
+        StreamingResponse com arquivo Excel consolidado (ou zip colunar)
     """
     try:
         logger.info(f"========================================")
@@ -1338,35 +2723,35 @@ async def process_contratos(
         
         # Validar bank_type
         bank_type_normalized = _normalize_bank_type_key(bank_type)
-        if bank_type_normalized not in ['bemge', 'minas_caixa']:
+        if bank_type_normalized not in BANK_TYPES_VALIDOS:
             raise HTTPException(
                 status_code=400,
                 detail="bank_type deve ser 'bemge' ou 'minas_caixa'"
             )
         
         # Validar filter_type
-        if filter_type not in ['auditado', 'nauditado', 'todos']:
+        if filter_type not in FILTER_TYPES_VALIDOS:
             raise HTTPException(
                 status_code=400,
                 detail="filter_type deve ser 'auditado', 'nauditado' ou 'todos'"
             )
         
         # Validar file_type
-        if file_type not in ['3026-11', '3026-12', '3026-15', 'todos']:
+        if file_type not in FILE_TYPES_VALIDOS:
             raise HTTPException(
                 status_code=400,
                 detail="file_type deve ser '3026-11', '3026-12', '3026-15' ou 'todos'"
             )
         
         # Validar period_filter_enabled
-        if period_filter_enabled not in ['true', 'false']:
+        if period_filter_enabled not in VALORES_BOOLEANOS:
             raise HTTPException(
                 status_code=400,
                 detail="period_filter_enabled deve ser 'true' ou 'false'"
             )
         
         # ✅ Validar habitacional_filter_enabled
-        if habitacional_filter_enabled not in ['true', 'false']:
+        if habitacional_filter_enabled not in VALORES_BOOLEANOS:
             raise HTTPException(
                 status_code=400,
                 detail="habitacional_filter_enabled deve ser 'true' ou 'false'"
@@ -1383,6 +2768,9 @@ async def process_contratos(
                 detail="Pelo menos um arquivo deve ser enviado"
             )
         
+        for f in files:
+            verificar_tamanho_upload(f)
+
         bank_name = get_bank_name(bank_type_normalized)
         sheet_names = get_sheet_names(bank_type_normalized)
         
@@ -1391,250 +2779,140 @@ async def process_contratos(
         base_dir = Path(f"arquivo_morto/{bank_folder}")
         filtragem_dir = Path("arquivo_morto/3026 - Filtragens")
         
+        if save_archive is None:
+            save_archive = SAVE_ARCHIVE
+        
         # Criar estrutura de pastas
-        try:
-            base_dir.mkdir(parents=True, exist_ok=True)
-            filtragem_dir.mkdir(parents=True, exist_ok=True)
-            logger.debug(f"Pastas criadas: {base_dir}, {filtragem_dir}")
-        except Exception as e:
-            logger.error(f"Erro ao criar pastas: {e}")
-            raise HTTPException(status_code=500, detail=f"Erro ao criar pastas: {str(e)}")
+        if save_archive:
+            try:
+                base_dir.mkdir(parents=True, exist_ok=True)
+                filtragem_dir.mkdir(parents=True, exist_ok=True)
+                logger.debug(f"Pastas criadas: {base_dir}, {filtragem_dir}")
+            except Exception as e:
+                logger.error(f"Erro ao criar pastas: {e}")
+                raise HTTPException(status_code=500, detail="Erro ao criar pastas do arquivo morto")
+        else:
+            logger.info("Arquivo morto desativado: cópias individuais não serão salvas")
         
-        # Estruturas para consolidar dados
-        all_contratos = []
+        # Arquivos de outro tipo (file_type) não são copiados para o disco nem lidos
+        ignorados = [f.filename for f in files if not arquivo_do_tipo(f.filename, file_type)]
+        if ignorados:
+            logger.info(f"Arquivos ignorados (não são {file_type}): {ignorados}")
+            files = [f for f in files if arquivo_do_tipo(f.filename, file_type)]
+
+        # Fase 1: copiar todos os uploads para arquivos temporários (I/O), antes de ocupar o pool.
+        # O worker recebe só o caminho: nada de bytes em memória nem cópia via pickle.
+        temporarios = await asyncio.gather(*(
+            asyncio.to_thread(_copiar_upload_para_temp, f.file) for f in files
+        ))
+
+        # Fase 2: processar os arquivos em paralelo no pool de processos, limitado pelo
+        # semáforo global (MAX_PARSE_CONCURRENCY) compartilhado entre as requisições
+        sem = _semaforo_leitura()
+        loop = asyncio.get_running_loop()
+        executor = get_process_executor()
+
+        async def _handle(file: UploadFile, caminho_temp: str, digest: str) -> dict:
+            async with sem:
+                try:
+                    return await loop.run_in_executor(
+                        executor,
+                        _processar_arquivo_em_processo,
+                        caminho_temp,
+                        file.filename,
+                        file_type,
+                        filter_type,
+                        bank_name,
+                        bank_type_normalized,
+                        base_dir,
+                        filtragem_dir,
+                        period_filter_active,
+                        reference_date,
+                        months_back,
+                        habitacional_filter_active,
+                        habitacional_reference_date,
+                        habitacional_months_back,
+                        digest if use_cache else None,
+                    )
+                finally:
+                    # Temporário apagado assim que o arquivo termina, sem esperar os demais
+                    _remover_temporario(caminho_temp)
+
+        try:
+            resultados_arquivos = await asyncio.gather(*(
+                _handle(f, caminho, digest) for f, (caminho, digest) in zip(files, temporarios)
+            ))
+        except BrokenProcessPool:
+            logger.error("Pool de processos quebrado (worker encerrado); será recriado", exc_info=True)
+            _descartar_executor_quebrado(executor)
+            raise HTTPException(
+                status_code=503,
+                detail="Processamento temporariamente indisponível, tente novamente"
+            )
+        finally:
+            # Os que não chegaram a rodar (erro ou cancelamento no meio do gather)
+            for caminho, _digest in temporarios:
+                _remover_temporario(caminho)
+
+        for resultado in resultados_arquivos:
+            if 'http_error' in resultado:
+                status_code, detail = resultado['http_error']
+                raise HTTPException(status_code=status_code, detail=detail)
+
+        # Consolidar na ordem de envio dos arquivos: cada lista é montada de uma vez
+        # a partir dos resultados (um único concat por aba mais adiante)
+        # Cada parte leva a chave (índice do arquivo, rótulo) para _concat_aba
+        partes_contratos = [
+            ((i, rotulo), df)
+            for i, r in enumerate(resultados_arquivos)
+            for rotulo, df in r['contratos']
+        ]
+        all_contratos = [df for _chave, df in partes_contratos]
         dados_por_aba = {
-            '3026-11': [],
-            '3026-15': []
+            aba: [
+                ((i, rotulo), df)
+                for i, r in enumerate(resultados_arquivos)
+                for rotulo, df in r['abas'][aba]
+            ]
+            for aba in ('3026-11', '3026-15')
         }
         dados_3026_12 = {
-            'todos': [],
-            'auditados': [],
-            'naud': [],
-            'todos_ultimos_2_meses': [],
-            'auditados_ultimos_2_meses': [],
-            'naud_ultimos_2_meses': []
+            chave: [
+                ((i, rotulo), df)
+                for i, r in enumerate(resultados_arquivos)
+                for rotulo, df in r['dados_3026_12'][chave]
+            ]
+            for chave in (
+                'todos', 'auditados', 'naud',
+                'todos_ultimos_2_meses', 'auditados_ultimos_2_meses', 'naud_ultimos_2_meses'
+            )
+        }
+        tem_3026_12 = any(r['tem_3026_12'] for r in resultados_arquivos)
+        # Mesmo caminho em dois arquivos: prevalece o último (como na gravação sequencial)
+        arquivos_para_salvar = {
+            caminho: df_salvar
+            for r in resultados_arquivos
+            for df_salvar, caminho in r['arquivos']
         }
-        tem_3026_12 = False
-        
-        # Processar cada arquivo
-        for file in files:
-            filename = file.filename or ""
-            filename_upper = filename.upper()
-            
-            logger.info(f"\n{'='*60}")
-            logger.info(f"📄 PROCESSANDO ARQUIVO: {filename}")
-            logger.info(f"{'='*60}")
-            
-            # Filtrar por tipo de arquivo se especificado
-            if file_type != "todos":
-                file_type_normalized = file_type.upper().replace("-", "")
-                if file_type.upper() not in filename_upper and file_type_normalized not in filename_upper:
-                    logger.debug(f"Arquivo {filename} ignorado (não é {file_type})")
-                    continue
-            
-            # Ler arquivo
-            try:
-                contents = await file.read()
-                df = pd.read_excel(io.BytesIO(contents), engine='openpyxl')
-                logger.info(f"✅ Arquivo lido: {len(df)} linhas, {len(df.columns)} colunas")
-            except Exception as e:
-                logger.error(f"❌ Erro ao ler arquivo {filename}: {e}")
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"Erro ao ler arquivo {filename}: {str(e)}"
-                )
-            
-            # Formatação de datas
-            df = format_date_columns(df)
-            df = format_object_columns_that_look_like_dates(df)
-            
-            # Remover colunas gerais
-            df = remove_general_columns(df)
-            
-            # Formatação da coluna CONTRATO
-            df = format_contrato_column(df)
-            
-            # Detectar tipo de arquivo
-            detected_file_type = detect_file_type(filename)
-            logger.info(f"Tipo detectado: {detected_file_type}")
-            
-            if detected_file_type == '3026-11':
-                df_processado, total_linhas, total_unicos, total_duplicados = process_3026_11(df, bank_name)
-
-                if df_processado.empty:
-                    logger.warning(f"⚠️  Arquivo {filename} resultou em DataFrame vazio")
-                    continue
-
-                df_processado['TIPO_ARQUIVO'] = '3026-11'
-                df_processado['BANCO'] = bank_name
-                df_processado['DUPLICADO'] = df_processado['CONTRATO'].duplicated(keep=False)
-
-                df_processado = filtrar_dataframe_por_tipo_auditado(df_processado, filter_type)
-
-                # ✅ APLICAR FILTRO HABITACIONAL (NOVO)
-                if habitacional_filter_active:
-                    logger.info(f"\n✅ APLICANDO FILTRO HABITACIONAL PARA 3026-11")
-                    df_processado = filtrar_planilha_contratos(
-                        df_processado,
-                        aplicar_periodo=False,
-                        aplicar_habitacional=True,
-                        reference_date=habitacional_reference_date,
-                        months_back=habitacional_months_back,
-                        bank_type=bank_type_normalized
-                    )
-                    logger.info(f"✅ Filtro habitacional aplicado: {len(df_processado)} registros")
-
-                # Filtro de período
-                if period_filter_active:
-                    logger.info(f"\n📅 APLICANDO FILTRO DE PERÍODO")
-                    df_processado = filtrar_planilha_contratos(
-                        df_processado,
-                        aplicar_periodo=True,
-                        reference_date=reference_date,
-                        months_back=months_back,
-                        bank_type=bank_type_normalized
-                    )
-
-                all_contratos.append(df_processado)
-                dados_por_aba['3026-11'].append(df_processado.copy())
-
-                n_arquivo = int(df_processado['CONTRATO'].nunique()) if 'CONTRATO' in df_processado.columns else len(df_processado)
-                save_filename = f"3026-11 - {bank_name} - {n_arquivo} (CONTRATOS).xlsx"
-                save_filepath = base_dir / save_filename
-                save_processed_file(df_processado, str(save_filepath))
-
-                if 'AUDITADO' in df_processado.columns:
-                    filepath_filtragem = filtragem_dir / save_filename
-                    save_processed_file(df_processado, str(filepath_filtragem))
-                
-                logger.info(f"✅ 3026-11 processado: {len(df_processado)} registros finais")
-
-            elif detected_file_type == '3026-15':
-                df_processado, total_linhas, total_unicos, total_duplicados = process_3026_15(df, bank_name)
-
-                if df_processado.empty:
-                    logger.warning(f"⚠️  Arquivo {filename} resultou em DataFrame vazio")
-                    continue
-
-                df_processado['TIPO_ARQUIVO'] = '3026-15'
-                df_processado['BANCO'] = bank_name
-                df_processado['DUPLICADO'] = df_processado['CONTRATO'].duplicated(keep=False)
-
-                df_processado = filtrar_dataframe_por_tipo_auditado(df_processado, filter_type)
-
-                if period_filter_active:
-                    logger.info(f"\n📅 APLICANDO FILTRO DE PERÍODO")
-                    df_processado = filtrar_planilha_contratos(
-                        df_processado,
-                        aplicar_periodo=True,
-                        reference_date=reference_date,
-                        months_back=months_back,
-                        bank_type=bank_type_normalized
-                    )
-
-                all_contratos.append(df_processado)
-                dados_por_aba['3026-15'].append(df_processado.copy())
-
-                n_arquivo = int(df_processado['CONTRATO'].nunique()) if 'CONTRATO' in df_processado.columns else len(df_processado)
-                save_filename = f"3026-15 - {bank_name} - {n_arquivo} (CONTRATOS).xlsx"
-                save_filepath = base_dir / save_filename
-                save_processed_file(df_processado, str(save_filepath))
-
-                if 'AUDITADO' in df_processado.columns:
-                    filepath_filtragem = filtragem_dir / save_filename
-                    save_processed_file(df_processado, str(filepath_filtragem))
-                
-                logger.info(f"✅ 3026-15 processado: {len(df_processado)} registros finais")
 
-            elif detected_file_type == '3026-12':
-                logger.info(f"🔧 Processando 3026-12...")
-                
-                resultados = processar_3026_12_com_abas(
-                    df,
-                    bank_name,
-                    bank_type_normalized,
-                    period_filter_active,
-                    reference_date,
-                    months_back
-                )
-                abas = resultados['abas']
-                stats = resultados['stats']
-                tem_3026_12 = True
-
-                logger.info(f"📋 Abas disponíveis: {list(abas.keys())}")
-                logger.info(f"📌 Escopo 3026-12 alinhado a filter_type={filter_type!r}")
-
-                chaves_para_dados = {
-                    'todos': 'todos',
-                    'aud': 'auditados',
-                    'naud': 'naud',
-                    'auditados_ultimos_2_meses': 'auditados_ultimos_2_meses',
-                    'naud_ultimos_2_meses': 'naud_ultimos_2_meses',
-                    'todos_ultimos_2_meses': 'todos_ultimos_2_meses'
-                }
-
-                for chave_aba, chave_dados in chaves_para_dados.items():
-                    redirect = _effective_aba_key_3026_12(chave_dados, filter_type)
-                    if redirect == '__skip__':
-                        continue
-                    aba_ler = chave_aba if redirect is None else redirect
-                    if aba_ler not in abas:
-                        continue
-                    subset = abas[aba_ler]
-                    if not subset.empty:
-                        logger.info(f"   Adicionando {chave_dados} (aba={aba_ler}): {len(subset)} registros")
-                        dados_3026_12[chave_dados].append(subset.copy())
-                    else:
-                        logger.debug(f"   {chave_dados} está vazio")
-
-                # Processar AUD e NAUD para salvar arquivos individuais e all_contratos
-                for tipo_label, subset_key_aba, subset_key_stats in [
-                    ('AUD', 'aud', 'aud'),
-                    ('NAUD', 'naud', 'naud')
-                ]:
-                    if filter_type == 'auditado' and subset_key_aba == 'naud':
-                        continue
-                    if filter_type == 'nauditado' and subset_key_aba == 'aud':
-                        continue
-                    df_subset = abas.get(subset_key_aba)
-                    if df_subset is None or df_subset.empty:
-                        logger.warning(f"   ⚠️  Subset {tipo_label} está vazio ou não existe")
-                        continue
-
-                    logger.info(f"   Processando {tipo_label}: {len(df_subset)} registros")
-
-                    # Adicionar a all_contratos (sem filtro adicional para não duplicar)
-                    all_contratos.append(df_subset.copy())
-
-                    # Para salvar, aplicar filtro se necessário
-                    df_para_salvar = df_subset.copy()
-                    
-                    if period_filter_active:
-                        logger.info(f"      Aplicando filtro de período em {tipo_label}...")
-                        df_para_salvar = filtrar_planilha_contratos(
-                            df_para_salvar,
-                            aplicar_periodo=True,
-                            reference_date=reference_date,
-                            months_back=months_back,
-                            bank_type=bank_type_normalized
-                        )
-                        logger.info(f"      {tipo_label} após filtro: {len(df_para_salvar)} registros")
-
-                    total_unicos = _stats_total_unicos(stats, subset_key_stats)
-                    if total_unicos <= 0 and 'CONTRATO' in df_subset.columns:
-                        total_unicos = int(df_subset['CONTRATO'].nunique())
-                    save_filename = f"3026-12 - {bank_name} - {tipo_label} - {total_unicos} (CONTRATOS).xlsx"
-                    save_filepath = base_dir / save_filename
-
-                    if not df_para_salvar.empty:
-                        logger.info(f"      Salvando {tipo_label}: {save_filename}")
-                        save_processed_file(df_para_salvar, str(save_filepath))
-                        filepath_filtragem = filtragem_dir / save_filename
-                        save_processed_file(df_para_salvar, str(filepath_filtragem))
-                    else:
-                        logger.warning(f"      ⚠️  {tipo_label} vazio após filtragem, não salvando arquivo")
-                
-                logger.info(f"✅ 3026-12 processado com sucesso")
+        if save_archive:
+            # O mesmo DataFrame vai para a pasta do banco e para Filtragens: serializar uma vez só
+            caminhos_por_df = {}
+            for caminho, df_salvar in arquivos_para_salvar.items():
+                caminhos_por_df.setdefault(id(df_salvar), (df_salvar, []))[1].append(caminho)
+            tarefas_arquivo = []
+            try:
+                for df_salvar, caminhos in caminhos_por_df.values():
+                    tarefas_arquivo.append(_agendar_arquivo_morto(loop.run_in_executor(
+                        executor, save_processed_file, df_salvar, *caminhos
+                    )))
+            except BrokenProcessPool:
+                # O relatório já está pronto: sem arquivo morto desta vez, mas a resposta sai
+                logger.error("Pool de processos quebrado ao agendar o arquivo morto; será recriado")
+                _descartar_executor_quebrado(executor)
+            # Arquivo morto fora do caminho da resposta, a menos que o chamador peça para esperar
+            if wait_for_archive:
+                await asyncio.gather(*tarefas_arquivo)
         
         # Consolidar todos os dados
         if not all_contratos:
@@ -1644,6 +2922,9 @@ async def process_contratos(
             )
 
         df_full = pd.concat(all_contratos, ignore_index=True)
+        if 'CONTRATO' in df_full.columns:
+            # Uma única passada de hash nas strings; resumos e repetidos trabalham sobre os códigos
+            df_full['CONTRATO'] = df_full['CONTRATO'].astype('category')
 
         logger.info(f"\n{'='*60}")
         logger.info(f"📊 CONSOLIDAÇÃO FINAL")
@@ -1651,11 +2932,16 @@ async def process_contratos(
         logger.info(f"Total de linhas (pré-escopo opção): {len(df_full)}")
 
         # Mesmo conjunto que o usuário escolheu no front: resumos = escopo; período aplica em cima
-        df_escopo = aplicar_escopo_filter_type(df_full, filter_type)
+        if 'AUDITADO_TIPO' in df_full.columns:
+            df_escopo = aplicar_escopo_filter_type(df_full, filter_type)
+        else:
+            # Só 3026-11/15: cada arquivo já passou por filtrar_dataframe_por_tipo_auditado
+            # no worker; normalizar AUDITADO de novo no consolidado não remove nada
+            df_escopo = df_full
         logger.info(f"Após filter_type={filter_type!r}: {len(df_escopo)} linhas no escopo consolidado")
 
         df_filtrado = filtrar_planilha_contratos(
-            df_escopo.copy(),
+            df_escopo,
             aplicar_periodo=period_filter_active,
             reference_date=reference_date,
             months_back=months_back,
@@ -1666,13 +2952,17 @@ async def process_contratos(
         # Quando desativado, calculamos sempre os últimos 2 meses (ref = hoje, months_back = 2).
         mb_periodo = months_back if period_filter_active else 2
         ref_periodo = reference_date if period_filter_active else None
-        df_ultimos_2_meses = filtrar_planilha_contratos(
-            df_escopo.copy(),
-            aplicar_periodo=True,
-            reference_date=ref_periodo,
-            months_back=mb_periodo,
-            bank_type=bank_type_normalized
-        )
+        if period_filter_active:
+            # Mesma chamada que gerou df_filtrado: não converter as datas de novo
+            df_ultimos_2_meses = df_filtrado
+        else:
+            df_ultimos_2_meses = filtrar_planilha_contratos(
+                df_escopo,
+                aplicar_periodo=True,
+                reference_date=ref_periodo,
+                months_back=mb_periodo,
+                bank_type=bank_type_normalized
+            )
 
         df_resumo = gerar_resumo_geral(df_escopo)
         df_repetidos = gerar_contratos_repetidos(df_escopo)
@@ -1681,104 +2971,83 @@ async def process_contratos(
         logger.info(f"✅ Dados filtrados: {len(df_filtrado)} registros")
         logger.info(f"✅ Resumos gerados com sucesso")
         
-        # Criar arquivo Excel consolidado
-        output = io.BytesIO()
+        # Abas da saída, na ordem do workbook: (nome, DataFrame, formatar, soma AE)
+        def _mensagem(texto: str) -> pd.DataFrame:
+            return pd.DataFrame({'Mensagem': [texto]})
 
-        logger.info(f"\n📝 Criando arquivo Excel consolidado...")
-
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            if not df_resumo.empty:
-                df_resumo.to_excel(writer, sheet_name='Resumo Geral', index=False)
-                apply_excel_formatting(writer, df_resumo, 'Resumo Geral')
-            else:
-                pd.DataFrame({'Mensagem': ['Resumo geral não disponível']}).to_excel(
-                    writer, sheet_name='Resumo Geral', index=False
-                )
+        abas_saida = []
+        if not df_resumo.empty:
+            abas_saida.append(('Resumo Geral', df_resumo, True, False))
+        else:
+            abas_saida.append(('Resumo Geral', _mensagem('Resumo geral não disponível'), False, False))
 
-            nome_repetidos = 'Contratos Repetidos'
-            if not df_repetidos.empty:
-                df_repetidos.to_excel(writer, sheet_name=nome_repetidos, index=False)
-                apply_excel_formatting(writer, df_repetidos, nome_repetidos)
-            else:
-                pd.DataFrame({'Mensagem': ['Nenhum contrato repetido encontrado']}).to_excel(
-                    writer, sheet_name=nome_repetidos, index=False
-                )
+        if not df_repetidos.empty:
+            abas_saida.append(('Contratos Repetidos', df_repetidos, True, False))
+        else:
+            abas_saida.append(('Contratos Repetidos', _mensagem('Nenhum contrato repetido encontrado'), False, False))
 
-            nome_por_banco = 'Contratos por Banco'
-            if not df_contratos_por_banco.empty:
-                df_contratos_por_banco.to_excel(writer, sheet_name=nome_por_banco, index=False)
-                apply_excel_formatting(writer, df_contratos_por_banco, nome_por_banco)
-            else:
-                pd.DataFrame({'Mensagem': ['Nenhum contrato por banco encontrado']}).to_excel(
-                    writer, sheet_name=nome_por_banco, index=False
-                )
+        if not df_contratos_por_banco.empty:
+            abas_saida.append(('Contratos por Banco', df_contratos_por_banco, True, False))
+        else:
+            abas_saida.append(('Contratos por Banco', _mensagem('Nenhum contrato por banco encontrado'), False, False))
+
+        if dados_por_aba['3026-11']:
+            df_3026_11 = _concat_aba(dados_por_aba['3026-11'], partes_contratos, df_full)
+            abas_saida.append((sheet_names['3026-11'][:31], df_3026_11, True, False))
+
+        if tem_3026_12:
+            if dados_3026_12['todos']:
+                df_3026_12_todos = _concat_aba(dados_3026_12['todos'], partes_contratos, df_full)
+                abas_saida.append((sheet_names['3026-12-TODOS'][:31], df_3026_12_todos, True, False))
+
+            if dados_3026_12['auditados']:
+                df_3026_12_aud = _concat_aba(dados_3026_12['auditados'], partes_contratos, df_full)
+                abas_saida.append((sheet_names['3026-12-AUD'][:31], df_3026_12_aud, True, True))
+
+            if dados_3026_12['naud']:
+                df_3026_12_naud = _concat_aba(dados_3026_12['naud'], partes_contratos, df_full)
+                abas_saida.append((sheet_names['3026-12-NAUD'][:31], df_3026_12_naud, True, True))
+
+            for chave, nome_chave in [
+                ('auditados_ultimos_2_meses', sheet_names['3026-12-ULTIMOS_AUD']),
+                ('naud_ultimos_2_meses', sheet_names['3026-12-ULTIMOS_NAUD']),
+                ('todos_ultimos_2_meses', sheet_names['3026-12-ULTIMOS_TODOS'])
+            ]:
+                if dados_3026_12[chave]:
+                    df_periodo = _concat_aba(dados_3026_12[chave], partes_contratos, df_full)
+                    abas_saida.append((nome_chave[:31], df_periodo, True, False))
+
+        if not df_filtrado.empty:
+            abas_saida.append(('Dados Filtrados', df_filtrado, True, False))
+        else:
+            abas_saida.append(('Dados Filtrados', _mensagem('Filtros removeram todos os contratos'), False, False))
 
-            if dados_por_aba['3026-11']:
-                df_3026_11 = pd.concat(dados_por_aba['3026-11'], ignore_index=True)
-                nome_aba_11 = sheet_names['3026-11'][:31]
-                df_3026_11.to_excel(writer, sheet_name=nome_aba_11, index=False)
-                apply_excel_formatting(writer, df_3026_11, nome_aba_11)
-
-            if tem_3026_12:
-                nome_12_todos = sheet_names['3026-12-TODOS'][:31]
-                if dados_3026_12['todos']:
-                    df_3026_12_todos = pd.concat(dados_3026_12['todos'], ignore_index=True)
-                    df_3026_12_todos.to_excel(writer, sheet_name=nome_12_todos, index=False)
-                    apply_excel_formatting(writer, df_3026_12_todos, nome_12_todos)
-
-                if dados_3026_12['auditados']:
-                    df_3026_12_aud = pd.concat(dados_3026_12['auditados'], ignore_index=True)
-                    nome_aba_12_aud = sheet_names['3026-12-AUD'][:31]
-                    df_3026_12_aud.to_excel(writer, sheet_name=nome_aba_12_aud, index=False)
-                    apply_excel_formatting(writer, df_3026_12_aud, nome_aba_12_aud)
-                    add_column_ae_sum(writer, df_3026_12_aud, nome_aba_12_aud)
-
-                if dados_3026_12['naud']:
-                    df_3026_12_naud = pd.concat(dados_3026_12['naud'], ignore_index=True)
-                    nome_aba_12_naud = sheet_names['3026-12-NAUD'][:31]
-                    df_3026_12_naud.to_excel(writer, sheet_name=nome_aba_12_naud, index=False)
-                    apply_excel_formatting(writer, df_3026_12_naud, nome_aba_12_naud)
-                    add_column_ae_sum(writer, df_3026_12_naud, nome_aba_12_naud)
-
-                for chave, nome_chave in [
-                    ('auditados_ultimos_2_meses', sheet_names['3026-12-ULTIMOS_AUD']),
-                    ('naud_ultimos_2_meses', sheet_names['3026-12-ULTIMOS_NAUD']),
-                    ('todos_ultimos_2_meses', sheet_names['3026-12-ULTIMOS_TODOS'])
-                ]:
-                    if dados_3026_12[chave]:
-                        df_periodo = pd.concat(dados_3026_12[chave], ignore_index=True)
-                        nome_periodo = nome_chave[:31]
-                        df_periodo.to_excel(writer, sheet_name=nome_periodo, index=False)
-                        apply_excel_formatting(writer, df_periodo, nome_periodo)
-
-            if not df_filtrado.empty:
-                df_filtrado.to_excel(writer, sheet_name='Dados Filtrados', index=False)
-                apply_excel_formatting(writer, df_filtrado, 'Dados Filtrados')
-            else:
-                pd.DataFrame({'Mensagem': ['Filtros removeram todos os contratos']}).to_excel(
-                    writer, sheet_name='Dados Filtrados', index=False
-                )
+        if dados_por_aba['3026-15']:
+            df_3026_15 = _concat_aba(dados_por_aba['3026-15'], partes_contratos, df_full)
+            abas_saida.append((sheet_names['3026-15'][:31], df_3026_15, True, False))
 
-            if dados_por_aba['3026-15']:
-                df_3026_15 = pd.concat(dados_por_aba['3026-15'], ignore_index=True)
-                nome_aba_15 = sheet_names['3026-15'][:31]
-                df_3026_15.to_excel(writer, sheet_name=nome_aba_15, index=False)
-                apply_excel_formatting(writer, df_3026_15, nome_aba_15)
+        nome_aba_periodo = f'Últimos {mb_periodo} Meses'[:31]
+        if not df_ultimos_2_meses.empty:
+            abas_saida.append((nome_aba_periodo, df_ultimos_2_meses, True, False))
+        else:
+            abas_saida.append((
+                nome_aba_periodo,
+                _mensagem(f'Nenhum contrato encontrado nos últimos {mb_periodo} meses'),
+                False,
+                False,
+            ))
+
+        if output_format in FORMATOS_COLUNARES and pa is None:
+            logger.warning(f"pyarrow não instalado: formato {output_format!r} indisponível, gerando xlsx")
+            output_format = 'xlsx'
+
+        if output_format in FORMATOS_COLUNARES:
+            logger.info(f"\n📝 Criando arquivo {output_format} consolidado (zip, uma tabela por aba)...")
+            output = escrever_zip_colunar(abas_saida, output_format)
+        else:
+            logger.info(f"\n📝 Criando arquivo Excel consolidado...")
+            output = escrever_xlsx_consolidado(abas_saida)
 
-            nome_aba_periodo = f'Últimos {mb_periodo} Meses'[:31]
-            if not df_ultimos_2_meses.empty:
-                df_ultimos_2_meses.to_excel(writer, sheet_name=nome_aba_periodo, index=False)
-                apply_excel_formatting(writer, df_ultimos_2_meses, nome_aba_periodo)
-            else:
-                pd.DataFrame({'Mensagem': [f'Nenhum contrato encontrado nos últimos {mb_periodo} meses']}).to_excel(
-                    writer, sheet_name=nome_aba_periodo, index=False
-                )
-        
-        # Resetar ponteiro e ler dados
-        output.seek(0)
-        excel_data = output.read()
-        output.close()
-        
         # Nome do arquivo de saída - varia com base no file_type
         filtro_nome = filter_type.upper()
         banco_nome = "BEMGE" if bank_type_normalized == "bemge" else "MINAS_CAIXA"
@@ -1798,7 +3067,8 @@ async def process_contratos(
         periodo_nome = f"_{months_back}MESES" if period_filter_active else ""
         habitacional_nome = "_HABITACIONAL" if habitacional_filter_active else ""  # ✅ NOVO
         
-        filename_output = f"contratos_{tipo_nome}_{banco_nome}_{filtro_nome}{periodo_nome}{habitacional_nome}_consolidado.xlsx"
+        extensao = 'zip' if output_format in FORMATOS_COLUNARES else 'xlsx'
+        filename_output = f"contratos_{tipo_nome}_{banco_nome}_{filtro_nome}{periodo_nome}{habitacional_nome}_consolidado.{extensao}"
         
         logger.info(f"\n{'='*60}")
         logger.info(f"✅ PROCESSAMENTO CONCLUÍDO COM SUCESSO")
@@ -1808,10 +3078,14 @@ async def process_contratos(
         logger.info(f"{'='*60}\n")
         
         return StreamingResponse(
-            io.BytesIO(excel_data),
-            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            iterar_em_blocos(output),
+            media_type=(
+                "application/zip" if output_format in FORMATOS_COLUNARES
+                else "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+            ),
             headers={
-                "Content-Disposition": f"attachment; filename={filename_output}"
+                "Content-Disposition": f"attachment; filename={filename_output}",
+                "Content-Length": str(output.getbuffer().nbytes)
             }
         )
         
@@ -1824,5 +3098,5 @@ async def process_contratos(
         logger.error(f"Traceback: {traceback.format_exc()}")
         raise HTTPException(
             status_code=500,
-            detail=f"Erro ao processar contratos: {str(e)}"
+            detail="Erro ao processar contratos"
         )
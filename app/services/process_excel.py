@@ -1,20 +1,25 @@
 import pandas as pd
 import io
+import logging
 from fastapi import HTTPException
 from fastapi.responses import StreamingResponse
+from app.services.process_contratos import iterar_em_blocos
 
-async def process_excel(file, tipo: str):
+logger = logging.getLogger(__name__)
+
+def process_excel(file, tipo: str):
     """
     Processa arquivo Excel:
     - Filtra por coluna AUDITADO (valores "AUDI" ou "NAUD")
     - Marca contratos duplicados na coluna CONTRATO
     - Cria resumo com totais
     - Retorna arquivo Excel compatível
+    Síncrona (pandas bloqueia): chamada por rota `def`, que o FastAPI roda no threadpool.
     """
     try:
-        # Ler o arquivo Excel
-        contents = await file.read()
-        df = pd.read_excel(io.BytesIO(contents), engine='openpyxl')
+        # Ler o arquivo Excel direto do arquivo temporário do upload (sem cópia em memória);
+        # calamine faz o parse em Rust, sem montar o DOM do openpyxl
+        df = pd.read_excel(file.file, engine='calamine')
         
         # Verificar se as colunas necessárias existem
         if 'AUDITADO' not in df.columns:
@@ -61,28 +66,26 @@ async def process_excel(file, tipo: str):
             # Aba com resumo
             resumo.to_excel(writer, sheet_name='Resumo', index=False)
         
-        # IMPORTANTE: Resetar o ponteiro para o início ANTES de ler
+        # Resetar o ponteiro: o próprio buffer é enviado, sem copiar os bytes
         output.seek(0)
         
-        # Ler todo o conteúdo do buffer
-        excel_data = output.read()
-        
-        # Fechar o buffer
-        output.close()
-        
         # Retornar como StreamingResponse
         return StreamingResponse(
-            io.BytesIO(excel_data),  # Criar novo BytesIO com os dados
+            iterar_em_blocos(output),
             media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
             headers={
-                "Content-Disposition": f"attachment; filename=planilha_processada_{tipo}.xlsx"
+                "Content-Disposition": f"attachment; filename=planilha_processada_{tipo}.xlsx",
+                # getbuffer() é uma view: tamanho sem copiar o conteúdo
+                "Content-Length": str(output.getbuffer().nbytes)
             }
         )
         
     except HTTPException:
         raise
     except Exception as e:
+        # Detalhes (traceback) só no log; o cliente recebe uma mensagem fixa
+        logger.error(f"Erro ao processar arquivo {file.filename}: {e}", exc_info=e)
         raise HTTPException(
             status_code=500,
-            detail=f"Erro ao processar arquivo: {str(e)}"
+            detail="Erro ao processar arquivo"
         )
@@ -1,16 +1,38 @@
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request, Depends, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from starlette.middleware.gzip import DEFAULT_EXCLUDED_CONTENT_TYPES
 from fastapi.exceptions import RequestValidationError
+from fastapi.encoders import jsonable_encoder
 from fastapi.responses import JSONResponse
-from typing import List, Optional
-import io
+from contextlib import asynccontextmanager
+from typing import Annotated, List, Literal, Optional
+import logging
+import logging.handlers
+import os
+import queue
+from pydantic import BaseModel, BeforeValidator, ValidationError, field_validator, model_validator
+from pydantic_core import PydanticCustomError
 import re
 import unicodedata
 
-import pandas as pd
-from app.services.process_contratos import process_contratos
+from app.services.process_contratos import (
+    process_contratos,
+    formato_saida,
+    ler_metadados_excel,
+    aquecer_leitura_excel,
+    verificar_tamanho_upload,
+    MAX_REQUEST_MB,
+    iniciar_process_executor,
+    shutdown_process_executor,
+)
 from app.routes import files
 
+# Único ponto de configuração do log (os módulos de app/ só criam seus loggers).
+# LOG_LEVEL=DEBUG liga o detalhamento por arquivo/filtro; o padrão fica fora do caminho quente
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper())
+logger = logging.getLogger(__name__)
+
 
 def _normalize_bank_type_form(raw: str) -> str:
     x = (raw or "").strip().lower().replace("-", "_").replace(" ", "_")
@@ -38,23 +60,204 @@ def _normalize_filter_type_form(raw: str) -> str:
     return s
 
 
-app = FastAPI()
+def _strip_form(raw: Optional[str]) -> str:
+    return raw.strip() if raw else ""
+
+
+MesesAtras = Literal[1, 2, 3, 4, 5, 6, 12]
+Booleano = Literal["true", "false"]
+
+# Mensagens da API por campo (mesmo texto e status 400 de antes da validação pelo Pydantic)
+MENSAGENS_CONTRATO_PARAMS = {
+    "file_type": "file_type inválido: '{valor}'. Valores aceitos: 3026-11, 3026-12, 3026-15, todos",
+    "filter_type": "filter_type deve ser 'auditado', 'nauditado' ou 'todos' (ou 'aud' / 'naud')",
+    "period_filter_enabled": "period_filter_enabled deve ser 'true' ou 'false'",
+    "habitacional_filter_enabled": "habitacional_filter_enabled deve ser 'true' ou 'false'",
+    "months_back": "months_back deve ser 1, 2, 3, 4, 5, 6 ou 12",
+    "habitacional_months_back": "habitacional_months_back deve ser 1, 2, 3, 4, 5, 6 ou 12",
+}
+
+
+class ContratoParams(BaseModel):
+    """
+    Campos de formulário do /processar_contratos/, normalizados e validados pelo Pydantic.
+    A ordem dos campos é a ordem das mensagens de erro (o primeiro erro vira o 400).
+    """
+    file_type: Annotated[Literal["3026-11", "3026-12", "3026-15", "todos"], BeforeValidator(_strip_form)]
+    bank_type: Annotated[str, BeforeValidator(_normalize_bank_type_form)]
+    filter_type: Annotated[Literal["auditado", "nauditado", "todos"], BeforeValidator(_normalize_filter_type_form)]
+    period_filter_enabled: Booleano
+    habitacional_filter_enabled: Booleano
+    months_back: MesesAtras
+    habitacional_months_back: MesesAtras
+    reference_date: Optional[str] = None
+    habitacional_reference_date: Optional[str] = None
+
+    @field_validator("*", mode="wrap")
+    @classmethod
+    def _mensagem_da_api(cls, valor, handler, info):
+        try:
+            return handler(valor)
+        except ValidationError:
+            mensagem = MENSAGENS_CONTRATO_PARAMS.get(info.field_name)
+            if mensagem is None:
+                raise
+            raise PydanticCustomError("valor_invalido", "{mensagem}", {"mensagem": mensagem.format(valor=valor)})
+
+    @model_validator(mode="after")
+    def _datas_obrigatorias(self):
+        # Com o filtro ativo, a data de referência correspondente é obrigatória
+        if self.period_filter_enabled == "true" and not self.reference_date:
+            raise PydanticCustomError(
+                "valor_invalido", "reference_date é obrigatório quando period_filter_enabled é 'true'"
+            )
+        if self.habitacional_filter_enabled == "true" and not self.habitacional_reference_date:
+            raise PydanticCustomError(
+                "valor_invalido",
+                "habitacional_reference_date é obrigatório quando habitacional_filter_enabled é 'true'",
+            )
+        return self
+
+    @classmethod
+    def as_form(
+        cls,
+        bank_type: str = Form(...),
+        filter_type: str = Form(...),
+        file_type: str = Form("todos"),
+        period_filter_enabled: str = Form("false"),
+        reference_date: Optional[str] = Form(None),
+        months_back: int = Form(2),
+        habitacional_filter_enabled: str = Form("false"),
+        habitacional_reference_date: Optional[str] = Form(None),
+        habitacional_months_back: int = Form(2),
+    ) -> "ContratoParams":
+        try:
+            # model_validate: os campos recebem o texto bruto do form, convertido pelos validadores
+            return cls.model_validate({
+                "file_type": file_type,
+                "bank_type": bank_type,
+                "filter_type": filter_type,
+                "period_filter_enabled": period_filter_enabled,
+                "habitacional_filter_enabled": habitacional_filter_enabled,
+                "months_back": months_back,
+                "habitacional_months_back": habitacional_months_back,
+                "reference_date": reference_date,
+                "habitacional_reference_date": habitacional_reference_date,
+            })
+        except ValidationError as e:
+            raise HTTPException(status_code=400, detail=e.errors()[0]["msg"])
+
+
+def _iniciar_log_em_fila() -> logging.handlers.QueueListener:
+    """
+    Os handlers do root passam a rodar numa thread própria (QueueListener): quem loga durante
+    a requisição só enfileira o registro, sem esperar a escrita no console.
+    """
+    raiz = logging.getLogger()
+    fila = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(fila, *raiz.handlers, respect_handler_level=True)
+    raiz.handlers = [logging.handlers.QueueHandler(fila)]
+    listener.start()
+    return listener
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    listener_logs = _iniciar_log_em_fila()
+    # Engines do Excel aquecidos neste processo (modo 'thread' e rotas fora do pool)
+    aquecer_leitura_excel()
+    # Pool de processos criado uma vez na subida (não por requisição) e encerrado na parada.
+    # Os workers vêm do forkserver, não de fork deste processo (que já tem a thread do log).
+    # Com gunicorn --preload o master só importa este módulo (nada de pool nem thread no
+    # import); o lifespan roda em cada UvicornWorker depois do fork, então cada worker web
+    # cria o próprio pool e a própria fila de log. Os workers sobem aqui, não no 1º request
+    iniciar_process_executor()
+    yield
+    shutdown_process_executor()
+    logging.getLogger().handlers = list(listener_logs.handlers)
+    listener_logs.stop()
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+class LimiteTamanhoRequisicao:
+    """
+    Middleware ASGI puro (sem BaseHTTPMiddleware: `send` passa intacto, a resposta mantém o
+    Content-Length e não há task extra por requisição). Recusa com 413 pelo Content-Length,
+    antes de o corpo ser recebido; sem Content-Length (chunked), conta os bytes do corpo
+    conforme chegam e interrompe a leitura ao passar do limite.
+    """
+
+    def __init__(self, app, max_bytes: int):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    def _erro(self) -> HTTPException:
+        return HTTPException(
+            status_code=413,
+            detail=f"Requisição muito grande (limite de {self.max_bytes // (1024 * 1024)} MB)"
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        for nome, valor in scope["headers"]:
+            if nome == b"content-length":
+                if valor.isdigit() and int(valor) > self.max_bytes:
+                    erro = self._erro()
+                    resposta = JSONResponse(status_code=413, content={"erro": erro.detail})
+                    await resposta(scope, receive, send)
+                    return
+                break
+
+        recebidos = 0
+
+        async def receive_limitado():
+            nonlocal recebidos
+            mensagem = await receive()
+            if mensagem["type"] == "http.request":
+                recebidos += len(mensagem.get("body", b""))
+                if recebidos > self.max_bytes:
+                    # HTTPException atravessa o parser do corpo do FastAPI e vira 413 no handler
+                    raise self._erro()
+            return mensagem
+
+        await self.app(scope, receive_limitado, send)
+
+
+# Registrado antes do CORS (fica por dentro dele) para que o 413 também leve os cabeçalhos CORS
+app.add_middleware(LimiteTamanhoRequisicao, max_bytes=MAX_REQUEST_MB * 1024 * 1024)
 
 # CONFIGURAÇÃO CORS - Melhorada com origens específicas
+# frozenset: o Starlette testa `origin in allow_origins` a cada requisição (hash, sem varrer lista)
+ORIGENS_PERMITIDAS = frozenset({
+    "https://leitorarquivos.onrender.com",
+    "http://localhost:5173",
+    "http://localhost:3000",
+    "http://127.0.0.1:5173",
+    "http://127.0.0.1:3000",
+})
+
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=[
-        "https://leitorarquivos.onrender.com",
-        "http://localhost:5173",
-        "http://localhost:3000",
-        "http://127.0.0.1:5173",
-        "http://127.0.0.1:3000",
-    ],
+    allow_origins=ORIGENS_PERMITIDAS,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
 )
 
+# Compressão das respostas JSON; xlsx e zip já são comprimidos e passam direto
+app.add_middleware(
+    GZipMiddleware,
+    minimum_size=1024,
+    compresslevel=5,
+    exclude_content_types=DEFAULT_EXCLUDED_CONTENT_TYPES + (
+        "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    ),
+)
+
 # Incluir rotas de arquivos
 app.include_router(files.router)
 
@@ -66,11 +269,21 @@ async def http_exception_handler(request: Request, exc: HTTPException):
         content={"erro": exc.detail}
     )
 
+@app.exception_handler(Exception)
+async def unhandled_exception_handler(request: Request, exc: Exception):
+    # Detalhes (traceback) só no log; o cliente recebe um 500 genérico
+    logger.error(f"Erro não tratado em {request.url.path}: {exc}", exc_info=exc)
+    return JSONResponse(
+        status_code=500,
+        content={"erro": "Erro interno do servidor"}
+    )
+
 @app.exception_handler(RequestValidationError)
 async def validation_exception_handler(request: Request, exc: RequestValidationError):
     return JSONResponse(
         status_code=422,
-        content={"erro": "Dados inválidos", "detalhes": str(exc)}
+        # Lista estruturada do Pydantic (campo, tipo, mensagem) em vez do texto formatado de str(exc)
+        content={"erro": "Dados inválidos", "detalhes": jsonable_encoder(exc.errors())}
     )
 
 @app.get("/")
@@ -83,32 +296,34 @@ async def health_check():
     return {"status": "ok", "message": "Servidor funcionando"}
 
 @app.post("/processar/")
-async def processar_excel(file: UploadFile = File(...)):
+def processar_excel(file: UploadFile = File(...)):
+    # def síncrono: o FastAPI roda no threadpool e a leitura não trava o event loop
+    verificar_tamanho_upload(file)
     try:
-        contents = await file.read()
-        df = pd.read_excel(io.BytesIO(contents))
-        total_linhas = len(df)
-        colunas = list(df.columns)
-        return {
-            "mensagem": "Arquivo processado com sucesso!",
-            "total_linhas": total_linhas,
-            "colunas": colunas
-        }
+        # Só metadados: cabeçalho e contagem de linhas direto do calamine, sem DataFrame.
+        # UploadFile.file já é um SpooledTemporaryFile: lido no lugar, sem cópia em bytes
+        total_linhas, colunas = ler_metadados_excel(file.file)
     except Exception as e:
-        return {"erro": str(e)}
+        # Arquivo ilegível é erro do cliente (400), não resposta 200 com "erro" no corpo;
+        # o motivo técnico fica só no log
+        logger.warning(f"Erro ao ler arquivo {file.filename}: {e}")
+        raise HTTPException(
+            status_code=400,
+            detail=f"Erro ao ler arquivo {file.filename}: arquivo Excel inválido ou corrompido"
+        )
+    return {
+        "mensagem": "Arquivo processado com sucesso!",
+        "total_linhas": total_linhas,
+        "colunas": colunas
+    }
 
 @app.post("/processar_contratos/")
 async def processar_contratos_endpoint(
-    bank_type: str = Form(...),
-    filter_type: str = Form(...),
-    file_type: str = Form("todos"),
-    period_filter_enabled: str = Form("false"),
-    reference_date: Optional[str] = Form(None),
-    months_back: int = Form(2),
-    habitacional_filter_enabled: str = Form("false"),  # ✅ NOVO
-    habitacional_reference_date: Optional[str] = Form(None),  # ✅ NOVO
-    habitacional_months_back: int = Form(2),  # ✅ NOVO
-    files: List[UploadFile] = File(...)
+    request: Request,
+    params: ContratoParams = Depends(ContratoParams.as_form),
+    files: List[UploadFile] = File(...),
+    nocache: bool = False,
+    formato: Optional[str] = Query(None, alias="format")
 ):
     """
     ✅ ATUALIZADO: Processa múltiplas planilhas Excel de contratos.
@@ -125,87 +340,52 @@ async def processar_contratos_endpoint(
     - habitacional_reference_date: "YYYY-MM-DD" (Form) - Data de referência habitacional (NOVO)
     - habitacional_months_back: 1, 2, 3, 4, 5, 6 ou 12 (Form) - Meses para trás habitacional (NOVO)
     - files: Lista de arquivos Excel (File)
+    - nocache: ?nocache=1 na URL força a leitura dos arquivos, ignorando o cache de planilhas
+    Campos de formulário validados por ContratoParams (400 com a mensagem do primeiro campo inválido).
     
     Retorna:
     - Arquivo Excel consolidado (.xlsx) como StreamingResponse
+    - Com Accept: application/vnd.apache.parquet (ou application/x-parquet),
+      application/vnd.apache.arrow.stream ou application/vnd.apache.arrow.file: zip com uma
+      tabela por aba (requer pyarrow)
+    - ?format=xlsx|parquet|arrow|arrow_file na URL tem prioridade sobre o Accept
+      (formato colunar pedido por ?format= sem pyarrow no servidor: 406; pelo Accept: xlsx)
     """
-    # Validar file_type no servidor
-    valid_file_types = ["3026-11", "3026-12", "3026-15", "todos"]
-    file_type_normalized = file_type.strip() if file_type else ""
-    if file_type_normalized not in valid_file_types:
-        raise HTTPException(
-            status_code=400,
-            detail=f"file_type inválido: '{file_type}'. Valores aceitos: {', '.join(valid_file_types)}"
-        )
-    file_type = file_type_normalized
-
-    bank_type = _normalize_bank_type_form(bank_type)
-    filter_type = _normalize_filter_type_form(filter_type)
-    if filter_type not in ["auditado", "nauditado", "todos"]:
-        raise HTTPException(
-            status_code=400,
-            detail="filter_type deve ser 'auditado', 'nauditado' ou 'todos' (ou 'aud' / 'naud')",
-        )
-    
-    # Validar period_filter_enabled
-    if period_filter_enabled not in ["true", "false"]:
-        raise HTTPException(
-            status_code=400,
-            detail="period_filter_enabled deve ser 'true' ou 'false'"
-        )
-    
-    # ✅ Validar habitacional_filter_enabled
-    if habitacional_filter_enabled not in ["true", "false"]:
-        raise HTTPException(
-            status_code=400,
-            detail="habitacional_filter_enabled deve ser 'true' ou 'false'"
-        )
-    
-    # Validar months_back
-    if months_back not in [1, 2, 3, 4, 5, 6, 12]:
-        raise HTTPException(
-            status_code=400,
-            detail="months_back deve ser 1, 2, 3, 4, 5, 6 ou 12"
-        )
-    
-    # ✅ Validar habitacional_months_back
-    if habitacional_months_back not in [1, 2, 3, 4, 5, 6, 12]:
-        raise HTTPException(
-            status_code=400,
-            detail="habitacional_months_back deve ser 1, 2, 3, 4, 5, 6 ou 12"
-        )
-    
-    # Se filtro de período está ativo, reference_date é obrigatório
-    if period_filter_enabled == "true" and not reference_date:
-        raise HTTPException(
-            status_code=400,
-            detail="reference_date é obrigatório quando period_filter_enabled é 'true'"
-        )
-    
-    # ✅ Se filtro habitacional está ativo, habitacional_reference_date é obrigatório
-    if habitacional_filter_enabled == "true" and not habitacional_reference_date:
-        raise HTTPException(
-            status_code=400,
-            detail="habitacional_reference_date é obrigatório quando habitacional_filter_enabled é 'true'"
-        )
-    
     try:
         return await process_contratos(
             files, 
-            bank_type, 
-            filter_type, 
-            file_type, 
-            period_filter_enabled,
-            reference_date,
-            months_back,
-            habitacional_filter_enabled,  # ✅ NOVO
-            habitacional_reference_date,   # ✅ NOVO
-            habitacional_months_back       # ✅ NOVO
+            params.bank_type, 
+            params.filter_type, 
+            params.file_type, 
+            params.period_filter_enabled,
+            params.reference_date,
+            params.months_back,
+            params.habitacional_filter_enabled,  # ✅ NOVO
+            params.habitacional_reference_date,   # ✅ NOVO
+            params.habitacional_months_back,      # ✅ NOVO
+            output_format=formato_saida(formato, request.headers.get("accept")),
+            use_cache=not nocache
         )
     except HTTPException:
         raise
     except Exception as e:
+        logger.error(f"Erro ao processar contratos: {e}", exc_info=e)
         raise HTTPException(
             status_code=500,
-            detail=f"Erro ao processar contratos: {str(e)}"
+            detail="Erro ao processar contratos"
         )
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    # Execução local (python main.py); em produção o Procfile sobe o gunicorn com o
+    # UvicornWorker do pacote uvicorn-worker.
+    # loop/http "auto" usam uvloop e httptools quando instalados (uvicorn[standard])
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=int(os.getenv("PORT", "8000")),
+        loop="auto",
+        http="auto",
+    )
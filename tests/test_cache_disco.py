@@ -0,0 +1,67 @@
+"""Cache de planilhas em disco (opcional, exige pyarrow): diretório privado e TTL."""
+import os
+import time
+
+import pandas as pd
+import pytest
+
+from app.services import process_contratos as pc
+
+pytest.importorskip("pyarrow")
+
+
+@pytest.fixture
+def cache_disco(tmp_path, monkeypatch):
+    diretorio = tmp_path / "planilhas"
+    monkeypatch.setattr(pc, "CACHE_PLANILHAS_DIR", str(diretorio))
+    monkeypatch.setattr(pc, "CACHE_PLANILHAS_DISCO_MB", 10)
+    monkeypatch.setattr(pc, "CACHE_PLANILHAS_DISCO_TTL", 60)
+    monkeypatch.setattr(pc, "_DIRETORIO_CACHE_OK", None)
+    return diretorio
+
+
+def _planilha() -> pd.DataFrame:
+    return pd.DataFrame({"CONTRATO": ["39", "40"], "VALOR": [1.5, 2.0]})
+
+
+def test_desligado_por_padrao(monkeypatch):
+    monkeypatch.setattr(pc, "CACHE_PLANILHAS_DISCO_MB", 0)
+    assert pc._caminho_planilha_em_disco("abc") is None
+
+
+def test_grava_e_le_em_diretorio_privado(cache_disco):
+    pc._guardar_planilha_em_disco("abc", _planilha())
+
+    assert os.stat(cache_disco).st_mode & 0o777 == 0o700
+    pd.testing.assert_frame_equal(pc._planilha_em_disco("abc"), _planilha())
+
+
+@pytest.mark.skipif(not hasattr(os, "getuid"), reason="permissões POSIX")
+def test_diretorio_aberto_a_outros_nao_e_usado(cache_disco):
+    cache_disco.mkdir(mode=0o777)
+    os.chmod(cache_disco, 0o777)
+
+    pc._guardar_planilha_em_disco("abc", _planilha())
+
+    assert pc._DIRETORIO_CACHE_OK is False
+    assert list(cache_disco.iterdir()) == []
+
+
+def test_arquivo_vencido_e_removido(cache_disco):
+    pc._guardar_planilha_em_disco("abc", _planilha())
+    caminho = cache_disco / "abc.arrow"
+    antigo = time.time() - 120
+    os.utime(caminho, (antigo, antigo))
+
+    assert pc._planilha_em_disco("abc") is None
+    assert not caminho.exists()
+
+
+def test_leitura_nao_renova_o_ttl(cache_disco):
+    pc._guardar_planilha_em_disco("abc", _planilha())
+    caminho = cache_disco / "abc.arrow"
+    gravado = time.time() - 30
+    os.utime(caminho, (gravado, gravado))
+
+    assert pc._planilha_em_disco("abc") is not None
+    assert os.stat(caminho).st_mtime == pytest.approx(gravado)
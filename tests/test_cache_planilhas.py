@@ -0,0 +1,57 @@
+"""Cache em memória das planilhas preparadas: limite em bytes e isolamento por cópia rasa."""
+from collections import OrderedDict
+
+import pandas as pd
+import pytest
+
+from app.services import process_contratos as pc
+
+
+@pytest.fixture
+def cache_vazio(monkeypatch):
+    monkeypatch.setattr(pc, "_CACHE_PLANILHAS", OrderedDict())
+    monkeypatch.setattr(pc, "_CACHE_PLANILHAS_BYTES", 0)
+    monkeypatch.setattr(pc, "CONTRATOS_EXECUTOR", "thread")
+
+
+def _planilha(n: int) -> pd.DataFrame:
+    return pd.DataFrame({"VALOR": range(n)}, dtype="int64")
+
+
+def test_limite_em_bytes_remove_as_mais_antigas(cache_vazio, monkeypatch):
+    monkeypatch.setattr(pc, "CACHE_PLANILHAS_MB", 1)
+    # ~400 KB cada: cabem duas em 1 MB
+    for chave in ("a", "b", "c"):
+        pc._guardar_planilha(chave, _planilha(50_000))
+
+    assert list(pc._CACHE_PLANILHAS) == ["b", "c"]
+    assert pc._CACHE_PLANILHAS_BYTES <= 1024 * 1024
+
+
+def test_planilha_maior_que_o_cache_nao_entra(cache_vazio, monkeypatch):
+    monkeypatch.setattr(pc, "CACHE_PLANILHAS_MB", 1)
+    pc._guardar_planilha("grande", _planilha(200_000))
+
+    assert pc._planilha_em_cache("grande") is None
+    assert pc._CACHE_PLANILHAS_BYTES == 0
+
+
+def test_modo_processo_divide_o_limite_entre_os_workers(cache_vazio, monkeypatch):
+    monkeypatch.setattr(pc, "CACHE_PLANILHAS_MB", 8)
+    monkeypatch.setattr(pc, "CONTRATOS_EXECUTOR", "process")
+    monkeypatch.setattr(pc, "MAX_WORKERS_CONTRATOS", 4)
+
+    assert pc._limite_cache_planilhas() == 2 * 1024 * 1024
+
+
+def test_alteracao_da_requisicao_nao_chega_ao_cache(cache_vazio, monkeypatch):
+    monkeypatch.setattr(pc, "CACHE_PLANILHAS_MB", 1)
+    pc._guardar_planilha("a", _planilha(3))
+
+    df = pc._planilha_em_cache("a")
+    df.loc[0, "VALOR"] = 99
+    df["NOVA"] = 1
+
+    guardado = pc._planilha_em_cache("a")
+    assert guardado["VALOR"].tolist() == [0, 1, 2]
+    assert "NOVA" not in guardado.columns
@@ -0,0 +1,43 @@
+"""_concat_aba liga as partes de uma aba aos contratos pela chave (arquivo, rótulo)."""
+import pandas as pd
+
+from app.services.process_contratos import _concat_aba
+
+
+def _partes():
+    a = pd.DataFrame({"CONTRATO": ["1", "2"], "VALOR": [1.0, 2.0]})
+    b = pd.DataFrame({"CONTRATO": ["3"], "VALOR": [3.0]})
+    c = pd.DataFrame({"CONTRATO": ["4", "5"], "VALOR": [4.0, 5.0]})
+    partes_contratos = [((0, "aud"), a), ((0, "naud"), b), ((1, "3026-11"), c)]
+    df_full = pd.concat([df for _chave, df in partes_contratos], ignore_index=True)
+    return partes_contratos, df_full
+
+
+def test_partes_copiadas_usam_a_fatia_do_consolidado():
+    partes_contratos, df_full = _partes()
+    # Cópias (como as que chegam do pool de processos): a chave continua valendo
+    partes = [(chave, df.copy()) for chave, df in partes_contratos[1:]]
+
+    resultado = _concat_aba(partes, partes_contratos, df_full)
+
+    pd.testing.assert_frame_equal(resultado, df_full.iloc[2:].reset_index(drop=True))
+
+
+def test_chaves_diferentes_nao_usam_a_fatia():
+    partes_contratos, df_full = _partes()
+    # Mesmo tamanho das partes dos contratos, mas outro recorte (aba 'todos' do arquivo 0)
+    outra = pd.DataFrame({"CONTRATO": ["9", "8"], "VALOR": [9.0, 8.0]})
+    partes = [((0, "todos"), outra), ((0, "naud"), partes_contratos[1][1])]
+
+    resultado = _concat_aba(partes, partes_contratos, df_full)
+
+    assert resultado["CONTRATO"].tolist() == ["9", "8", "3"]
+
+
+def test_numero_de_linhas_diferente_cai_no_concat():
+    partes_contratos, df_full = _partes()
+    partes = [((0, "aud"), partes_contratos[0][1].iloc[:1]), ((0, "naud"), partes_contratos[1][1])]
+
+    resultado = _concat_aba(partes, partes_contratos, df_full)
+
+    assert resultado["CONTRATO"].tolist() == ["1", "3"]
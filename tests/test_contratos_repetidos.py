@@ -0,0 +1,78 @@
+"""
+Resumo Geral x Contratos Repetidos: com filtro de período, parte das linhas marcadas como
+DUPLICADO no arquivo perde o par; o total CONTRATOS_DUPLICADOS do resumo tem de bater com
+as linhas da aba de repetidos.
+"""
+import io
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+from fastapi.testclient import TestClient
+from openpyxl import load_workbook
+
+import main
+from app.services import process_contratos as pc
+
+
+def _planilha_3026_11(n: int = 120) -> bytes:
+    rng = np.random.default_rng(0)
+    referencia = datetime(2026, 10, 1)
+    nomes = [f"COL{i}" for i in range(35)]
+    nomes[0], nomes[1], nomes[2], nomes[3] = "AGENCIA", "CODB", "CONTRATO", "IDD"
+    nomes[5], nomes[6], nomes[7], nomes[8] = "AUDITADO", "DEST.PAGAM", "DEST.COMPLEM", "DT.ASS."
+    dados = {nome: rng.integers(0, 100, n) for nome in nomes}
+    # Poucos contratos para muitas linhas: repetidos com datas espalhadas por ~6 meses
+    dados["CONTRATO"] = rng.integers(1000, 1000 + n // 3, n)
+    dados["CODB"] = np.full(n, 52101)
+    dados["AUDITADO"] = rng.choice(["AUDI", "NAUD"], n)
+    dados["DEST.PAGAM"] = rng.choice(["ABC", "DEF"], n)
+    dados["DEST.COMPLEM"] = rng.choice(["ABC", "DEF"], n)
+    for i in (8, 19, 23, 24, 25, 30, 31, 32, 33):
+        dados[nomes[i]] = [referencia - timedelta(days=int(d)) for d in rng.integers(0, 180, n)]
+    buffer = io.BytesIO()
+    pd.DataFrame(dados).to_excel(buffer, index=False)
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def cliente(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(pc, "CONTRATOS_EXECUTOR", "thread")
+    monkeypatch.setattr(pc, "SAVE_ARCHIVE", False)
+    pc.shutdown_process_executor()
+    yield TestClient(main.app)
+    pc.shutdown_process_executor()
+
+
+def _aba(workbook, nome: str) -> list:
+    return list(workbook[nome].iter_rows(values_only=True))
+
+
+def test_resumo_e_repetidos_batem_com_filtro_de_periodo(cliente):
+    resposta = cliente.post(
+        "/processar_contratos/?nocache=1",
+        data={
+            "bank_type": "minas_caixa",
+            "filter_type": "todos",
+            "period_filter_enabled": "true",
+            "reference_date": "2026-10-01",
+            "months_back": "3",
+        },
+        files=[("files", ("3026-11 teste.xlsx", _planilha_3026_11()))],
+    )
+    assert resposta.status_code == 200
+    workbook = load_workbook(io.BytesIO(resposta.content))
+
+    resumo = _aba(workbook, "Resumo Geral")
+    coluna = resumo[0].index("CONTRATOS_DUPLICADOS")
+    total = next(linha for linha in resumo if linha[0] == "TOTAL GERAL")[coluna]
+    repetidos = _aba(workbook, "Contratos Repetidos")
+    assert repetidos[0][0] != "Mensagem"
+
+    assert total == len(repetidos) - 1
+    # O cenário tem de ter marcas sem par (senão o teste não cobre nada)
+    filtrados = _aba(workbook, "Dados Filtrados")
+    coluna_dup = filtrados[0].index("DUPLICADO")
+    assert sum(1 for linha in filtrados[1:] if linha[coluna_dup]) > total
@@ -0,0 +1,78 @@
+"""Escolha do formato de saída (?format= / Accept) e o zip colunar gerado com pyarrow."""
+import io
+import zipfile
+
+import pandas as pd
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+import main
+from app.services import process_contratos as pc
+
+
+def test_format_explicito_tem_prioridade(monkeypatch):
+    monkeypatch.setattr(pc, "pa", object())
+    assert pc.formato_saida(" Parquet ", "application/vnd.apache.arrow.stream") == "parquet"
+    assert pc.formato_saida("xlsx", "application/vnd.apache.parquet") == "xlsx"
+
+
+def test_format_invalido_e_400():
+    with pytest.raises(HTTPException) as erro:
+        pc.formato_saida("csv", None)
+    assert erro.value.status_code == 400
+
+
+def test_accept_negociado(monkeypatch):
+    monkeypatch.setattr(pc, "pa", object())
+    assert pc.formato_saida(None, "text/html, application/vnd.apache.arrow.file;q=0.9") == "arrow_file"
+    assert pc.formato_saida(None, "*/*") == "xlsx"
+    assert pc.formato_saida(None, None) == "xlsx"
+
+
+def test_sem_pyarrow_format_explicito_e_406_e_accept_cai_no_xlsx(monkeypatch):
+    monkeypatch.setattr(pc, "pa", None)
+    for formato in ("parquet", "arrow", "arrow_file"):
+        with pytest.raises(HTTPException) as erro:
+            pc.formato_saida(formato, None)
+        assert erro.value.status_code == 406
+    assert pc.formato_saida(None, "application/vnd.apache.parquet") == "xlsx"
+    assert pc.formato_saida("xlsx", None) == "xlsx"
+
+
+def test_rota_sem_pyarrow_responde_406(monkeypatch):
+    monkeypatch.setattr(pc, "pa", None)
+    resposta = TestClient(main.app).post(
+        "/processar_contratos/?format=parquet",
+        data={"bank_type": "minas_caixa", "filter_type": "todos"},
+        files=[("files", ("3026-11.xlsx", b"x"))],
+    )
+    assert resposta.status_code == 406
+
+
+@pytest.mark.parametrize("formato", ["parquet", "arrow", "arrow_file"])
+def test_escrever_zip_colunar(formato):
+    pa = pytest.importorskip("pyarrow")
+    import pyarrow.parquet as pq
+
+    df = pd.DataFrame({
+        "CONTRATO": ["0001", "0002"],
+        "VALOR": [1.5, 2.0],
+        "DATA": pd.to_datetime(["2026-01-31", "2026-02-28"]),
+    })
+    abas = [("Resumo", df, False, False), ("Vazia", pd.DataFrame({"MENSAGEM": ["nada"]}), False, False)]
+    with zipfile.ZipFile(pc.escrever_zip_colunar(abas, formato)) as zf:
+        extensao = pc.FORMATOS_COLUNARES[formato]
+        assert zf.namelist() == [f"01 - Resumo.{extensao}", f"02 - Vazia.{extensao}"]
+        dados = zf.read(f"01 - Resumo.{extensao}")
+
+    if formato == "parquet":
+        tabela = pq.read_table(io.BytesIO(dados))
+    elif formato == "arrow_file":
+        tabela = pa.ipc.open_file(pa.BufferReader(dados)).read_all()
+    else:
+        tabela = pa.ipc.open_stream(pa.BufferReader(dados)).read_all()
+    lido = tabela.to_pandas()
+    assert lido["CONTRATO"].tolist() == ["0001", "0002"]
+    assert lido["VALOR"].tolist() == [1.5, 2.0]
+    assert list(lido["DATA"].dt.strftime("%Y-%m-%d")) == ["2026-01-31", "2026-02-28"]
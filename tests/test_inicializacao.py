@@ -0,0 +1,58 @@
+"""
+Com gunicorn --preload o master importa o main antes do fork dos workers web: o import não
+pode criar o pool nem threads; só o lifespan (em cada worker, depois do fork) cria o pool.
+"""
+import os
+import subprocess
+import sys
+
+from fastapi.testclient import TestClient
+
+from app.services import process_contratos
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_import_nao_cria_pool_nem_threads():
+    # Interpretador novo: aqui o main já foi importado por outros módulos de teste
+    codigo = (
+        "import threading\n"
+        "antes = threading.active_count()\n"
+        "import main\n"
+        "from app.services import process_contratos\n"
+        "assert process_contratos._PROCESS_EXECUTOR is None, 'pool criado no import'\n"
+        "assert threading.active_count() == antes, threading.enumerate()\n"
+    )
+    resultado = subprocess.run(
+        [sys.executable, "-c", codigo], cwd=RAIZ, capture_output=True, text=True, timeout=120
+    )
+    assert resultado.returncode == 0, resultado.stderr
+
+
+def test_lifespan_cria_e_encerra_o_pool():
+    import main
+
+    with TestClient(main.app):
+        assert process_contratos._PROCESS_EXECUTOR is not None
+    assert process_contratos._PROCESS_EXECUTOR is None
+
+
+def test_lifespan_sobe_os_workers(monkeypatch):
+    import main
+
+    monkeypatch.setattr(process_contratos, "CONTRATOS_EXECUTOR", "process")
+    monkeypatch.setattr(process_contratos, "MAX_WORKERS_CONTRATOS", 2)
+    with TestClient(main.app):
+        # Workers já vivos antes da primeira requisição
+        assert len(process_contratos._PROCESS_EXECUTOR._processes) == 2
+
+
+def test_workers_aquecidos_antes_da_primeira_requisicao(monkeypatch):
+    import main
+
+    monkeypatch.setattr(process_contratos, "CONTRATOS_EXECUTOR", "process")
+    monkeypatch.setattr(process_contratos, "MAX_WORKERS_CONTRATOS", 2)
+    with TestClient(main.app):
+        executor = process_contratos._PROCESS_EXECUTOR
+        futuros = [executor.submit(process_contratos._worker_pronto) for _ in range(4)]
+        assert all(aquecido for _pid, aquecido in (f.result() for f in futuros))
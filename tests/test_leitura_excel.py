@@ -0,0 +1,59 @@
+"""
+Regressão da leitura rápida (_read_excel_fast): o resultado tem de ser o mesmo do
+pd.read_excel(engine='openpyxl') usado antes, inclusive na conversão de texto só com dígitos.
+"""
+import io
+from datetime import datetime
+
+import pandas as pd
+import pytest
+from openpyxl import Workbook
+
+from app.services import process_contratos
+from app.services.process_contratos import _read_excel_fast, format_contrato_column
+
+
+def _planilha_com_ids_em_texto() -> bytes:
+    wb = Workbook()
+    ws = wb.active
+    ws.append(["AGENCIA", "CODB", "CONTRATO", "IDD", None, "AUDITADO", "AUDITADO"])
+    ws.append([1, "52101", "00000039", "000123", "x", "AUDI", "NA"])
+    ws.append([2, 52102, 39, 123, None, "NAUD", "N/A"])
+    ws.append([None, None, None, None, None, None, None])
+    ws.append([3.0, "52101", "0000045", "000045", 1.5, None, datetime(2026, 9, 15)])
+    buffer = io.BytesIO()
+    wb.save(buffer)
+    return buffer.getvalue()
+
+
+@pytest.fixture(params=["calamine", "openpyxl"])
+def leitor(request, monkeypatch):
+    if request.param == "openpyxl":
+        monkeypatch.setattr(process_contratos, "CalamineWorkbook", None)
+    elif process_contratos.CalamineWorkbook is None:
+        pytest.skip("python-calamine não instalado")
+    return request.param
+
+
+def test_mesmo_resultado_do_read_excel(leitor):
+    conteudo = _planilha_com_ids_em_texto()
+    esperado = pd.read_excel(io.BytesIO(conteudo), engine="openpyxl")
+    pd.testing.assert_frame_equal(_read_excel_fast(conteudo), esperado)
+
+
+def test_ids_em_texto_viram_numero(leitor):
+    df = _read_excel_fast(_planilha_com_ids_em_texto())
+
+    assert list(df.columns) == [
+        "AGENCIA", "CODB", "CONTRATO", "IDD", "Unnamed: 4", "AUDITADO", "AUDITADO.1"
+    ]
+    assert df["CODB"].iloc[0] == 52101
+    assert df["IDD"].tolist()[:2] == [123, 123]
+    # Linha em branco no meio é mantida (skip_blank_lines=False, como no read_excel)
+    assert len(df) == 4
+    assert pd.isna(df["AUDITADO.1"].iloc[0]) and pd.isna(df["AUDITADO.1"].iloc[1])
+
+    contratos = format_contrato_column(df)["CONTRATO"].tolist()
+    # '00000039' (texto) e 39 (número) são o mesmo contrato, como no read_excel
+    assert contratos[0] == contratos[1] == "39"
+    assert contratos[3] == "45"
@@ -0,0 +1,56 @@
+"""Middleware LimiteTamanhoRequisicao: 413 pelo Content-Length ou pela contagem do corpo."""
+from fastapi import FastAPI, File, HTTPException, Request, UploadFile
+from fastapi.responses import JSONResponse
+from fastapi.testclient import TestClient
+
+import main
+from main import LimiteTamanhoRequisicao
+
+
+def _app_com_limite(max_bytes: int) -> FastAPI:
+    app = FastAPI()
+    app.add_middleware(LimiteTamanhoRequisicao, max_bytes=max_bytes)
+
+    @app.exception_handler(HTTPException)
+    async def _erro(request: Request, exc: HTTPException):
+        return JSONResponse(status_code=exc.status_code, content={"erro": exc.detail})
+
+    @app.post("/envio/")
+    def envio(file: UploadFile = File(...)):
+        return {"tamanho": file.size}
+
+    return app
+
+
+def test_content_length_acima_do_limite():
+    cliente = TestClient(_app_com_limite(1024))
+    resposta = cliente.post("/envio/", files={"file": ("a.xlsx", b"x" * 4096)})
+    assert resposta.status_code == 413
+
+
+def test_corpo_chunked_acima_do_limite():
+    cliente = TestClient(_app_com_limite(1024))
+
+    def corpo():
+        for _ in range(4):
+            yield b"x" * 512
+
+    resposta = cliente.post(
+        "/envio/",
+        content=corpo(),
+        headers={"content-type": "multipart/form-data; boundary=abc"},
+    )
+    assert resposta.status_code == 413
+    assert "content-length" not in {k.lower() for k in resposta.request.headers}
+
+
+def test_dentro_do_limite_passa():
+    cliente = TestClient(_app_com_limite(1024 * 1024))
+    resposta = cliente.post("/envio/", files={"file": ("a.xlsx", b"x" * 4096)})
+    assert resposta.json() == {"tamanho": 4096}
+
+
+def test_resposta_pequena_mantem_content_length_sem_gzip():
+    resposta = TestClient(main.app).get("/health", headers={"accept-encoding": "gzip"})
+    assert resposta.headers["content-length"] == str(len(resposta.content))
+    assert "content-encoding" not in resposta.headers
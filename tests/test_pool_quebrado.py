@@ -0,0 +1,48 @@
+"""
+Worker do pool morto por SIGKILL (ex.: OOM killer): a requisição atingida recebe 503 e a
+seguinte já roda num pool novo, em vez de 500 para sempre.
+"""
+import os
+import signal
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from app.services import process_contratos as pc
+from tests.test_contratos_repetidos import _planilha_3026_11
+
+
+@pytest.fixture
+def cliente(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(pc, "CONTRATOS_EXECUTOR", "process")
+    monkeypatch.setattr(pc, "SAVE_ARCHIVE", False)
+    pc.shutdown_process_executor()
+    yield TestClient(main.app)
+    pc.shutdown_process_executor()
+
+
+def _enviar(cliente, conteudo: bytes):
+    return cliente.post(
+        "/processar_contratos/?nocache=1",
+        data={"bank_type": "minas_caixa", "filter_type": "todos"},
+        files=[("files", ("3026-11.xlsx", conteudo))],
+    )
+
+
+def test_pool_quebrado_e_recriado(cliente):
+    conteudo = _planilha_3026_11(30)
+    assert _enviar(cliente, conteudo).status_code == 200
+    executor = pc._PROCESS_EXECUTOR
+    assert executor is not None
+
+    for pid in list(executor._processes):
+        os.kill(pid, signal.SIGKILL)
+
+    assert _enviar(cliente, conteudo).status_code == 503
+    assert pc._PROCESS_EXECUTOR is None
+
+    assert _enviar(cliente, conteudo).status_code == 200
+    assert pc._PROCESS_EXECUTOR is not None
+    assert pc._PROCESS_EXECUTOR is not executor